@@ -0,0 +1,183 @@
+"""
+Local stand-in of the github api for the benchmarks
+
+It serves, for the pull requests of a synthetic repository:
+* the pulls api (list with pagination and Link headers, single pull request, commits)
+* the labels of the issues
+* the search api (merged pull requests, `merged:>date` and `merged:>=date` qualifiers)
+* the graphql queries of githubflow_release
+with ETag/304 support, a latency on each request and rate limit headers.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+RATE_LIMIT = 5000
+RATE_LIMIT_WINDOW = 3600  # in seconds
+EXCLUDED_LABEL_EVERY = 7  # one pull request out of 7 is labelled 'not_in_changelog'
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeGithub(object):
+    def __init__(self, pull_requests, repository='bench/repo', latency=0.02, rate_limit=RATE_LIMIT):
+        self.pull_requests = {pr['number']: pr for pr in pull_requests}
+        self.repository = repository
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.calls = {}  # endpoint -> number of calls
+        self.not_modified = 0
+        self._reset = int(time.time()) + RATE_LIMIT_WINDOW
+        self._lock = threading.Lock()
+        self._server = None
+        self.url = None
+
+    def start(self):
+        handler = type('Handler', (_Handler,), {'github': self})
+        self._server = _Server(('127.0.0.1', 0), handler)
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls = {}
+            self.not_modified = 0
+
+    def count(self, endpoint):
+        """ count a call, returns the rate limit remaining """
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            return max(0, self.rate_limit - sum(self.calls.values()))
+
+    def pr_json(self, pr):
+        number = pr['number']
+        url = '{}/repos/{}'.format(self.url, self.repository)
+        labels = [{'name': 'not_in_changelog'}] if number % EXCLUDED_LABEL_EVERY == 0 else []
+        return {'number': number,
+                'title': 'feature {}'.format(number),
+                'html_url': 'https://github.com/{}/pull/{}'.format(self.repository, number),
+                'state': 'closed',
+                'head': {'sha': pr['head']},
+                'base': {'ref': 'master'},
+                'merged_at': _iso(pr['merged_at']),
+                'updated_at': _iso(pr['merged_at']),
+                'labels': labels,
+                'commits': len(pr['commits']),
+                'commits_url': '{}/pulls/{}/commits'.format(url, number),
+                '_links': {'issue': {'href': '{}/issues/{}'.format(url, number)}}}
+
+    def graphql_node(self, pr):
+        payload = self.pr_json(pr)
+        return {'number': payload['number'],
+                'title': payload['title'],
+                'url': payload['html_url'],
+                'headRefOid': pr['head'],
+                'mergedAt': payload['merged_at'],
+                'labels': {'nodes': payload['labels']},
+                'commits': {'pageInfo': {'hasNextPage': False},
+                            'nodes': [{'commit': {'oid': sha}} for sha in pr['commits']]}}
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    github = None  # set by FakeGithub.start
+    protocol_version = 'HTTP/1.1'  # keep-alive, as github
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, endpoint, payload, headers=None, status=200):
+        remaining = self.github.count(endpoint)
+        time.sleep(self.github.latency)
+        body = json.dumps(payload).encode('utf-8')
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            with self.github._lock:
+                self.github.not_modified += 1
+            status, body = 304, b''
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-RateLimit-Limit', str(self.github.rate_limit))
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Reset', str(self.github._reset))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _paginated(self, endpoint, path, query, items, wrap=None):
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        headers = {}
+        if page < last:
+            def link(n):
+                return '{}{}?{}'.format(self.github.url, path, urlencode(dict(query, page=n)))
+            headers['Link'] = '<{}>; rel="next", <{}>; rel="last"'.format(link(page + 1), link(last))
+        page_items = items[(page - 1) * per_page:page * per_page]
+        self._send(endpoint, wrap(page_items) if wrap else page_items, headers)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        repo = '/repos/{}'.format(self.github.repository)
+        prs = self.github.pull_requests
+
+        if url.path == repo + '/pulls':
+            key = 'merged_at' if query.get('sort') == 'updated' else 'number'
+            items = [self.github.pr_json(pr) for pr in sorted(prs.values(), key=lambda p: p[key], reverse=True)]
+            return self._paginated('pulls', url.path, query, items)
+
+        if url.path == '/search/issues':
+            merged = re.search(r'merged:(>=?)(\S+)', query.get('q', ''))
+            since = datetime.fromisoformat(merged.group(2).replace('Z', '+00:00')).timestamp() if merged else 0
+            strict = merged is not None and merged.group(1) == '>'
+            items = [dict(self.github.pr_json(pr), pull_request={'merged_at': _iso(pr['merged_at'])})
+                     for pr in sorted(prs.values(), key=lambda p: p['number'], reverse=True)
+                     if pr['merged_at'] > since or (not strict and pr['merged_at'] == since)]
+            return self._paginated('search', url.path, query, items,
+                                   wrap=lambda page: {'total_count': len(items), 'items': page})
+
+        match = re.match(r'^{}/(pulls|issues)/(\d+)(/commits|/labels)?$'.format(re.escape(repo)), url.path)
+        if match and int(match.group(2)) in prs:
+            pr = prs[int(match.group(2))]
+            if match.group(3) == '/commits':
+                return self._send('commits', [{'sha': sha} for sha in pr['commits']])
+            if match.group(3) == '/labels':
+                return self._send('labels', self.github.pr_json(pr)['labels'])
+            if match.group(1) == 'pulls':
+                return self._send('pull', self.github.pr_json(pr))
+        self._send('not_found', {'message': 'Not Found'}, status=404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        query, variables = request['query'], request.get('variables', {})
+        prs = sorted(self.github.pull_requests.values(), key=lambda p: p['number'], reverse=True)
+        if 'pullRequests(' in query:
+            start = int(variables.get('cursor') or 0)
+            data = {'pullRequests': {'pageInfo': {'hasNextPage': start + 100 < len(prs),
+                                                  'endCursor': str(start + 100)},
+                                     'nodes': [self.github.graphql_node(pr) for pr in prs[start:start + 100]]}}
+        else:
+            numbers = [int(n) for n in re.findall(r'pullRequest\(number: (\d+)\)', query)]
+            data = {'pr{}'.format(n): self.github.graphql_node(self.github.pull_requests[n])
+                    for n in numbers if n in self.github.pull_requests}
+        self._send('graphql', {'data': {'repository': data}})
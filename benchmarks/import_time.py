@@ -0,0 +1,66 @@
+"""Import time of the console scripts
+
+Each entry point module is imported in a fresh interpreter (`python -X importtime`) a few times, the median of
+its cumulative import time is compared to a budget. The heavy dependencies (git, requests, yaml) must not be
+loaded by the import of the entry points, only when a code path needs them.
+The exit code is 1 if an entry point is over budget or loads a heavy dependency.
+
+Usage:
+  import_time.py [--runs <n>] [--budget <ms>]
+  import_time.py (-h | --help)
+
+Options:
+  -h --help       Show this screen.
+  --runs <n>      Number of imports of each module  [default: 5]
+  --budget <ms>   Maximum import time of an entry point, in milliseconds  [default: 150]
+"""
+import os
+import statistics
+import subprocess
+import sys
+from docopt import docopt
+
+ENTRY_POINTS = ['githubflow_release.run', 'githubflow_release.new_version']
+HEAVY_MODULES = ['git', 'gitdb', 'requests', 'yaml']
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable] + list(args), env=env, cwd=ROOT, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def import_time(module):
+    """ cumulative import time of a module in a fresh interpreter, in milliseconds """
+    output = _python('-X', 'importtime', '-c', 'import {}'.format(module)).stderr
+    for line in output.splitlines():
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative) / 1000.
+    raise RuntimeError('no import time found for {}'.format(module))
+
+
+def heavy_modules_loaded(module):
+    code = 'import sys, {}; print(" ".join(m for m in {!r} if m in sys.modules))'.format(module, HEAVY_MODULES)
+    return _python('-c', code).stdout.split()
+
+
+def main():
+    arguments = docopt(__doc__)
+    runs = int(arguments['--runs'])
+    budget = float(arguments['--budget'])
+
+    ok = True
+    for module in ENTRY_POINTS:
+        duration = statistics.median(import_time(module) for _ in range(runs))
+        heavy = heavy_modules_loaded(module)
+        status = 'ok' if duration <= budget and not heavy else 'FAIL'
+        ok = ok and status == 'ok'
+        print('{:<35} {:8.1f}ms  {}{}'.format(module, duration, status,
+                                              '  (loads {})'.format(', '.join(heavy)) if heavy else ''))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Checks of githubflow_release_daemon with recorded github webhooks
+
+A synthetic repository (30 pull requests, the last 5 not released) is served by the fake github, and the daemon
+is started on a copy of it for each scenario:
+* scan: the payloads of `webhooks/` are posted in order, signed like github does. After each one, the answer of
+  the daemon and the pull requests of its changelog are checked against the `expect` of the payload.
+* index and search: a dry run and a release (pushed) are asked to the daemon with these PR discoveries, then the
+  push of the release branch must leave no PR to release.
+
+The payloads are the ones github sends (only the fields used are kept), `@head:N@` is replaced by the sha of
+the head of the pull request N of the synthetic repository.
+
+Usage:
+  replay_webhooks.py [--work-dir <DIR>] [--timeout <s>]
+  replay_webhooks.py (-h | --help)
+
+Options:
+  -h --help           Show this screen.
+  --work-dir <DIR>    Directory of the synthetic repository (a temporary directory by default)
+  --timeout <s>       Time given to the daemon to start or to refresh  [default: 30]
+"""
+import glob
+import hashlib
+import hmac
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from docopt import docopt
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+from fake_github import FakeGithub  # noqa: E402
+import synthetic_repo  # noqa: E402
+
+ROOT = os.path.dirname(BENCHMARKS_DIR)
+REPOSITORY = 'bench/repo'
+NB_PRS = 30
+NB_RELEASED = 25
+SECRET = 'replay'
+
+
+def _free_address():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return '127.0.0.1:{}'.format(s.getsockname()[1])
+
+
+def _wait_ready(url, process, timeout):
+    end = time.time() + timeout
+    while time.time() < end:
+        if process.poll() is not None:
+            return False
+        try:
+            requests.get(url + '/health', timeout=1)
+            return True
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    return False
+
+
+def load_fixture(path, heads):
+    with open(path) as f:
+        text = re.sub(r'@head:(\d+)@', lambda m: heads[int(m.group(1))], f.read())
+    return json.loads(text)
+
+
+def post_webhook(url, fixture):
+    body = json.dumps(fixture['payload']).encode('utf-8')
+    headers = {'X-GitHub-Event': fixture['event'], 'Content-Type': 'application/json'}
+    if fixture.get('signed', True):
+        headers['X-Hub-Signature-256'] = 'sha256=' + hmac.new(SECRET.encode('utf-8'), body,
+                                                              hashlib.sha256).hexdigest()
+    return requests.post(url + '/webhook', data=body, headers=headers, timeout=30)
+
+
+def check(url, fixture, response, timeout):
+    """ list of the differences with the expected result, empty if ok """
+    expect = fixture['expect']
+    errors = []
+    if response.status_code != expect.get('status', 200):
+        errors.append('status {} instead of {}'.format(response.status_code, expect.get('status', 200)))
+    elif 'result' in expect and response.json().get('result') != expect['result']:
+        errors.append('result {} instead of {}'.format(response.json().get('result'), expect['result']))
+
+    # a refresh is done in the background, its result is waited for
+    end = time.time() + (timeout if expect.get('result') == 'refresh scheduled' else 0)
+    while True:
+        pull_requests = requests.get(url + '/changelog', timeout=30).json()['pull_requests']
+        numbers = [pr['number'] for pr in pull_requests]
+        if numbers == expect['pull_requests'] or time.time() >= end:
+            break
+        time.sleep(0.2)
+    if numbers != expect['pull_requests']:
+        errors.append('pull requests {} instead of {}'.format(numbers, expect['pull_requests']))
+    titles = {str(pr['number']): pr['title'] for pr in pull_requests}
+    for number, title in expect.get('titles', {}).items():
+        if titles.get(number) != title:
+            errors.append(u'title of {} is {!r} instead of {!r}'.format(number, titles.get(number), title))
+    return errors
+
+
+def start_daemon(work, github, pr_discovery, timeout):
+    """ the daemon process and its url, None if it did not start """
+    address = _free_address()
+    url = 'http://{}'.format(address)
+    command = [sys.executable, '-m', 'githubflow_release.daemon', '--github-repo', REPOSITORY,
+               '--project-path', work, '--github-api-url', github.url, '--no-cache', '--listen', address,
+               '--webhook-secret', SECRET, '--pr-discovery', pr_discovery, '--auto-push']
+    env = dict(os.environ, PYTHONPATH=ROOT, LOGLEVEL=os.environ.get('LOGLEVEL', 'WARNING'))
+    daemon = subprocess.Popen(command, env=env)
+    if not _wait_ready(url, daemon, timeout):
+        daemon.terminate()
+        return daemon, None
+    return daemon, url
+
+
+def replay(url, heads, timeout):
+    """ the payloads of webhooks/ in order, returns the (name, errors) of each check """
+    results = []
+    for path in sorted(glob.glob(os.path.join(BENCHMARKS_DIR, 'webhooks', '*.json'))):
+        fixture = load_fixture(path, heads)
+        results.append((os.path.basename(path), check(url, fixture, post_webhook(url, fixture), timeout)))
+    return results
+
+
+def release(url, heads, timeout):
+    """ a dry run and a release with the pending PR, then a refresh after the push of the release branch """
+    results = []
+    pending = [30, 29, 27, 26]
+    response = requests.post(url + '/release', json={'release_type': 'minor', 'dry_run': True}, timeout=60)
+    errors = ['status {}: {}'.format(response.status_code, response.text)] if response.status_code != 200 else \
+        ['PR {} not in the changelog'.format(n) for n in pending
+         if '/pull/{}>'.format(n) not in response.json()['changelog']]
+    results.append(('dry run', errors))
+
+    response = requests.post(url + '/release', json={'release_type': 'minor'}, timeout=60)
+    errors = ['status {}: {}'.format(response.status_code, response.text)] if response.status_code != 200 else \
+        ([] if response.json()['released'] else ['nothing released'])
+    results.append(('release', errors))
+
+    # the release has been pushed: the background refresh must not find any PR to release anymore
+    fixture = {'event': 'push', 'payload': {'ref': 'refs/heads/release', 'forced': False},
+               'expect': {'result': 'refresh scheduled', 'pull_requests': []}}
+    results.append(('refresh after the release', check(url, fixture, post_webhook(url, fixture), timeout)))
+    return results
+
+
+SCENARIOS = [('scan', replay), ('index', release), ('search', release)]
+
+
+def main():
+    arguments = docopt(__doc__)
+    timeout = float(arguments['--timeout'])
+    work_dir = arguments['--work-dir'] or tempfile.mkdtemp(prefix='githubflow_release_webhooks')
+    directory = os.path.join(work_dir, 'repository')
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    synthetic_repo.build(directory, NB_PRS, NB_RELEASED, nb_tags=3, nb_branches=2)
+    with open(os.path.join(directory, 'pull_requests.json')) as f:
+        pull_requests = json.load(f)
+    heads = {pr['number']: pr['head'] for pr in pull_requests}
+
+    github = FakeGithub(pull_requests, repository=REPOSITORY, latency=0).start()
+    failures = 0
+    try:
+        for pr_discovery, scenario in SCENARIOS:
+            # the releases change the repositories, each scenario works on a copy
+            copy = os.path.join(work_dir, pr_discovery)
+            shutil.rmtree(copy, ignore_errors=True)
+            shutil.copytree(os.path.join(directory, 'upstream.git'), os.path.join(copy, 'upstream.git'))
+            shutil.copytree(os.path.join(directory, 'work'), os.path.join(copy, 'work'), symlinks=True)
+            work = os.path.join(copy, 'work')
+            subprocess.check_call(['git', '-C', work, 'remote', 'set-url', 'upstream',
+                                   os.path.join(copy, 'upstream.git')])
+
+            daemon, url = start_daemon(work, github, pr_discovery, timeout)
+            try:
+                results = scenario(url, heads, timeout) if url else [('start of the daemon', ['it did not start'])]
+            finally:
+                daemon.terminate()
+                daemon.wait()
+            for name, errors in results:
+                failures += bool(errors)
+                print('{:<8} {:<40} {}'.format(pr_discovery, name, 'ok' if not errors else 'FAILED'))
+                for error in errors:
+                    print('  ' + error)
+    finally:
+        github.stop()
+        if not arguments['--work-dir']:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
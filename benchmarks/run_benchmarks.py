@@ -0,0 +1,143 @@
+"""Benchmarks of githubflow_release on synthetic repositories and a local fake github
+
+For each scale (number of pull requests in the repository), a repository is built once, and each scenario is
+run on a fresh copy of it, against a fake github answering with some latency. The wall time, the number of
+github api calls (seen by the fake github) and the number of git commands (from --metrics-file) are reported.
+
+Usage:
+  run_benchmarks.py [--scales <list>] [--scenarios <list>] [--pending <n>] [--latency <s>]
+                    [--work-dir <DIR>] [--output <FILE>] [--release-args <args>]
+  run_benchmarks.py (-h | --help)
+
+Options:
+  -h --help               Show this screen.
+  --scales <list>         Number of pull requests of the repositories  [default: 100,1000,10000]
+  --scenarios <list>      Scenarios to run, among release, dry-run, hotfix, new-version, new-version-remote
+                          [default: release,dry-run,hotfix,new-version,new-version-remote]
+  --pending <n>           Number of pull requests merged since the last release  [default: 50]
+  --latency <s>           Latency of the fake github, in seconds  [default: 0.02]
+  --work-dir <DIR>        Directory of the repositories (kept between runs)  [default: /tmp/githubflow_release_bench]
+  --output <FILE>         Write the results in a json file
+  --release-args <args>   More arguments given to githubflow_release (ex: "--backend graphql")  [default: ]
+"""
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from docopt import docopt
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+from fake_github import FakeGithub  # noqa: E402
+import synthetic_repo  # noqa: E402
+
+ROOT = os.path.dirname(BENCHMARKS_DIR)
+REPOSITORY = 'bench/repo'
+NB_TAGS = 10
+NB_BRANCHES = 50
+NB_HOTFIX_PR = 2
+
+
+def scenario_command(scenario, github, released, extra_args):
+    release = [sys.executable, '-m', 'githubflow_release.run', '--github-repo', REPOSITORY,
+               '--github-api-url', github.url, '--no-cache'] + extra_args
+    new_version = [sys.executable, '-m', 'githubflow_release.new_version', '--no-cache']
+    if scenario == 'release':
+        return release + ['--release-type', 'minor']
+    if scenario == 'dry-run':
+        return release + ['--release-type', 'minor', '--dry-run']
+    if scenario == 'hotfix':
+        hotfixes = [str(released + i + 1) for i in range(NB_HOTFIX_PR)]
+        return release + ['--release-type', 'hotfix'] + [a for n in hotfixes for a in ('--hotfix-pr-id', n)]
+    if scenario == 'new-version':
+        return new_version + ['--release-type', 'minor']
+    if scenario == 'new-version-remote':
+        return new_version + ['--release-type', 'minor', '--tag-source', 'remote']
+    raise ValueError('unknown scenario {}'.format(scenario))
+
+
+def prepare(work_dir, nb_prs, pending):
+    """ the synthetic repository of a scale, built once """
+    directory = os.path.join(work_dir, '{}-{}'.format(nb_prs, pending))
+    if not os.path.exists(os.path.join(directory, 'pull_requests.json')):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        start = time.time()
+        synthetic_repo.build(directory, nb_prs, max(0, nb_prs - pending), NB_TAGS, NB_BRANCHES)
+        print('built a repository of {} PR in {:.1f}s'.format(nb_prs, time.time() - start))
+    with open(os.path.join(directory, 'pull_requests.json')) as f:
+        return directory, json.load(f)
+
+
+def run_scenario(directory, scenario, github, released, extra_args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # the scenarios change the repository, each one works on a copy
+        shutil.copytree(os.path.join(directory, 'upstream.git'), os.path.join(tmp, 'upstream.git'))
+        shutil.copytree(os.path.join(directory, 'work'), os.path.join(tmp, 'work'), symlinks=True)
+        work = os.path.join(tmp, 'work')
+        subprocess.check_call(['git', '-C', work, 'remote', 'set-url', 'upstream', os.path.join(tmp, 'upstream.git')])
+
+        metrics_file = os.path.join(tmp, 'metrics.json')
+        command = scenario_command(scenario, github, released, extra_args) + ['--metrics-file', metrics_file]
+
+        github.reset_counts()
+        env = dict(os.environ, PYTHONPATH=ROOT, LOGLEVEL='WARNING')
+        start = time.perf_counter()
+        process = subprocess.run(command, cwd=work, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        wall_time = time.perf_counter() - start
+
+        result = {'scenario': scenario,
+                  'exit_code': process.returncode,
+                  'wall_time': round(wall_time, 3),
+                  'api_calls': sum(github.calls.values()),
+                  'api_calls_by_endpoint': dict(github.calls),
+                  'not_modified': github.not_modified}
+        if os.path.exists(metrics_file):
+            with open(metrics_file) as f:
+                metrics = json.load(f)
+            result['git_commands'] = metrics['counters'].get('git_commands', 0)
+            result['phases'] = {name: phase['duration'] for name, phase in metrics['phases'].items()}
+        if process.returncode:
+            result['stderr'] = process.stderr[-2000:]
+        return result
+
+
+def main():
+    arguments = docopt(__doc__)
+    scales = [int(s) for s in arguments['--scales'].split(',')]
+    scenarios = arguments['--scenarios'].split(',')
+    pending = int(arguments['--pending'])
+    extra_args = shlex.split(arguments['--release-args'])
+
+    results = []
+    print('{:>7} {:<20} {:>9} {:>9} {:>9}  {}'.format('PR', 'scenario', 'time (s)', 'api calls', 'git cmds',
+                                                     'exit'))
+    for nb_prs in scales:
+        directory, pull_requests = prepare(arguments['--work-dir'], nb_prs, pending)
+        released = max(0, nb_prs - pending)
+        github = FakeGithub(pull_requests, repository=REPOSITORY, latency=float(arguments['--latency'])).start()
+        try:
+            for scenario in scenarios:
+                result = run_scenario(directory, scenario, github, released, extra_args)
+                result['nb_prs'] = nb_prs
+                results.append(result)
+                print('{:>7} {:<20} {:>9.2f} {:>9} {:>9}  {}'.format(nb_prs, scenario, result['wall_time'],
+                                                                    result['api_calls'],
+                                                                    result.get('git_commands', '-'),
+                                                                    result['exit_code']))
+        finally:
+            github.stop()
+
+    if arguments['--output']:
+        with open(arguments['--output'], 'w') as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any(r['exit_code'] for r in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Synthetic repositories for the benchmarks, built with `git fast-import`
+
+The `upstream.git` bare repository has:
+* a master branch with one merge commit ("Merge pull request #N from bench/feature-N") per pull request, the
+  commit of each pull request is also kept as refs/pull/N/head, as github does
+* a release branch and version tags, the last tag being on the release branch
+* some stale feature branches
+
+`work` is a clone of it, with `upstream` as remote, and `pull_requests.json` describes the pull requests for the
+fake github server.
+"""
+import json
+import os
+import subprocess
+
+START_DATE = 1577836800  # 2020-01-01, the pull request N is merged N minutes later
+AUTHOR = 'Bench <bench@example.com>'
+
+
+def merged_at(number):
+    return START_DATE + number * 60
+
+
+def _data(text):
+    data = text.encode('utf-8')
+    return b'data ' + str(len(data)).encode() + b'\n' + data + b'\n'
+
+
+def fast_import_stream(nb_prs, released, nb_tags, nb_branches):
+    """ the fast-import commands of the repository, and the list of the pull requests """
+    out = []
+    pull_requests = []
+    mark = 0
+
+    def new_mark():
+        nonlocal mark
+        mark += 1
+        return mark
+
+    def commit(ref, date, message, parents, files):
+        commit_mark = new_mark()
+        out.append('commit {}\nmark :{}\n'.format(ref, commit_mark).encode())
+        out.append('author {a} {d} +0000\ncommitter {a} {d} +0000\n'.format(a=AUTHOR, d=date).encode())
+        out.append(_data(message))
+        if parents:
+            out.append('from :{}\n'.format(parents[0]).encode())
+        for parent in parents[1:]:
+            out.append('merge :{}\n'.format(parent).encode())
+        for path, content in files:
+            out.append('M 100644 inline {}\n'.format(path).encode())
+            out.append(_data(content))
+        out.append(b'\n')
+        return commit_mark
+
+    changelog = 'bench (0.0.0) UNRELEASED; urgency=medium\n\n  * init\n\n -- {}  Wed, 01 Jan 2020 00:00:00 +0000\n'
+    master = commit('refs/heads/master', START_DATE, 'init', [],
+                    [('README', 'benchmark repository\n'), ('debian/changelog', changelog.format(AUTHOR))])
+
+    # the tags are spread on the released pull requests, the last one on the release point
+    tag_points = {released * (i + 1) // nb_tags: i for i in range(nb_tags)} if released and nb_tags else {}
+    feature_marks = []
+    for number in range(1, nb_prs + 1):
+        date = merged_at(number)
+        path = 'src/{}/feature_{}'.format(number % 100, number)
+        feature = commit('refs/pull/{}/head'.format(number), date - 30, 'feature {}'.format(number), [master],
+                         [(path, 'feature {}\n'.format(number))])
+        master = commit('refs/heads/master', date,
+                        'Merge pull request #{n} from bench/feature-{n}\n\nfeature {n}'.format(n=number),
+                        [master, feature], [(path, 'feature {}\n'.format(number))])
+        feature_marks.append(feature)
+        pull_requests.append({'number': number, 'head': feature, 'merged_at': date})
+        if number == released:
+            out.append('reset refs/heads/release\nfrom :{}\n\n'.format(master).encode())
+        if number in tag_points:
+            out.append('tag v0.{}.0\nfrom :{}\n'.format(tag_points[number] + 1, master).encode())
+            out.append('tagger {} {} +0000\n'.format(AUTHOR, date).encode())
+            out.append(_data('Version 0.{}.0\n'.format(tag_points[number] + 1)))
+    if not released:
+        out.append('reset refs/heads/release\nfrom :1\n\n'.encode())
+
+    for i in range(min(nb_branches, len(feature_marks))):
+        out.append('reset refs/heads/feature-{}\nfrom :{}\n\n'.format(i, feature_marks[-1 - i]).encode())
+    out.append(b'done\n')
+    return b''.join(out), pull_requests
+
+
+def build(directory, nb_prs, released, nb_tags=10, nb_branches=10):
+    """ build the repository in `directory` (which must not exist), returns the path of the clone """
+    upstream = os.path.join(directory, 'upstream.git')
+    work = os.path.join(directory, 'work')
+    subprocess.check_call(['git', 'init', '-q', '--bare', upstream])
+
+    stream, pull_requests = fast_import_stream(nb_prs, released, nb_tags, nb_branches)
+    marks_file = os.path.join(directory, 'marks')
+    subprocess.run(['git', 'fast-import', '--quiet', '--done', '--export-marks={}'.format(marks_file)],
+                   input=stream, cwd=upstream, check=True)
+    with open(marks_file) as f:
+        marks = dict(line.split() for line in f)
+    for pr in pull_requests:
+        pr['head'] = marks[':{}'.format(pr['head'])]
+        pr['commits'] = [pr['head']]
+
+    subprocess.check_call(['git', 'clone', '-q', '-o', 'upstream', upstream, work])
+    subprocess.check_call(['git', '-C', work, 'config', 'user.name', 'Bench'])
+    subprocess.check_call(['git', '-C', work, 'config', 'user.email', 'bench@example.com'])
+    with open(os.path.join(directory, 'pull_requests.json'), 'w') as f:
+        json.dump(pull_requests, f)
+    return work
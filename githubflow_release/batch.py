@@ -0,0 +1,187 @@
+"""Github flow release of several repositories
+
+The repositories of the manifest are released in parallel (one process per repository, at most --jobs at a time),
+sharing the github rate limit and the github api cache. A failure in one repository does not stop the others,
+a summary is displayed at the end.
+
+Example of manifest:
+
+    defaults:               # values for all the repositories
+      release_type: minor
+      remote_name: upstream
+    repositories:
+      - project_path: /path/project_a
+        github_repo: User/project_a
+      - project_path: /path/project_b
+        github_repo: User/project_b
+        release_type: hotfix
+        hotfix_pr_ids: [42]
+
+The values of a repository are the parameters of `githubflow_release.release.release`, they override the
+defaults of the manifest, which override the `gitflow_release.yml` of the repository.
+
+Usage:
+  githubflow_release_batch <manifest>
+                     [--jobs <n>]
+                     [--github-user <user>]
+                     [--github-token <token>]
+                     [--no-cache | --cache-dir <DIR>]
+                     [--dry-run]
+                     [--auto-push]
+  githubflow_release_batch (-h | --help)
+  githubflow_release_batch --version
+
+Options:
+  -h --help                 Show this screen.
+  --version                 Show version.
+  --jobs <n>                Number of repositories released at the same time  [default: 4]
+  --github-user <user>      Github user
+  --github-token <token>    Github token
+  --no-cache                Do not use the github api cache
+  --cache-dir <DIR>         Github api cache directory (default: ~/.cache/githubflow_release)
+  --dry-run                 Display the changelogs without doing the releases
+  --auto-push               Automatic push release and tags
+"""
+import contextlib
+import inspect
+import io
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+from docopt import docopt
+import yaml
+from githubflow_release.run import read_defaults_file
+
+
+class _RateLimitManager(BaseManager):
+    pass
+
+
+def _shared_rate_limiter_manager():
+    """ a manager process holding the RateLimiter shared by all the releases """
+    from githubflow_release.github import RateLimiter
+    _RateLimitManager.register('RateLimiter', RateLimiter, exposed=['set_limit', 'pause', 'delay'])
+    manager = _RateLimitManager()
+    manager.start()
+    return manager
+
+
+def read_manifest(path, release_parameters):
+    """ the list of the release parameters of each repository of a manifest """
+    with open(path) as f:
+        manifest = yaml.safe_load(f) or {}
+    defaults = manifest.get('defaults') or {}
+    repositories = []
+    for repository in manifest.get('repositories') or []:
+        project_path = repository.get('project_path', defaults.get('project_path', '.'))
+        # like run.py, the gitflow_release.yml of the project gives default values
+        project_defaults = read_defaults_file(os.path.join(project_path, 'gitflow_release.yml'))
+        parameters = {k: v for k, v in project_defaults.items() if k in release_parameters}
+        parameters.update(defaults)
+        parameters.update(repository)
+        unknown = set(parameters) - set(release_parameters)
+        if unknown:
+            logging.fatal('unknown parameters for {}: {}'.format(project_path, ', '.join(sorted(unknown))))
+            exit(2)
+        repositories.append(parameters)
+    return repositories
+
+
+def _release_repository(parameters, rate_limiter_proxy):
+    """ release one repository, in a worker process. Never raises, the outcome is returned """
+    from githubflow_release.github import RateLimiter
+    from githubflow_release.release import release
+
+    class SharedRateLimiter(RateLimiter):
+        """ the state of the rate limit is in the manager process, only the waits are done here """
+        def __init__(self, proxy):
+            self._proxy = proxy
+
+        def set_limit(self, resource, remaining, limit, reset):
+            self._proxy.set_limit(resource, remaining, limit, reset)
+
+        def pause(self, seconds):
+            self._proxy.pause(seconds)
+
+        def delay(self, resource):
+            return self._proxy.delay(resource)
+
+    name = parameters.get('github_repo') or parameters.get('project_path')
+    logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(logging.Formatter('[{}] %(levelname)s:%(message)s'.format(name)))
+
+    result = {'repository': name, 'version': None, 'error': None}
+    output = io.StringIO()  # the changelogs of the dry runs are displayed in the summary, not mixed together
+    start = time.time()
+    try:
+        with contextlib.redirect_stdout(output):
+            result['version'] = release(rate_limiter=SharedRateLimiter(rate_limiter_proxy), **parameters)
+        if result['version']:
+            result['status'] = 'released'
+        else:
+            result['status'] = 'dry run' if parameters.get('dry_run') else 'nothing to release'
+    except SystemExit as e:
+        result['status'] = 'done' if not e.code else 'failed'
+        if e.code:
+            result['error'] = 'exit code {}'.format(e.code)
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        result['status'] = 'failed'
+        result['error'] = u'{}: {}'.format(type(e).__name__, e)
+    result['duration'] = time.time() - start
+    result['output'] = output.getvalue()
+    return result
+
+
+def _result(future, parameters):
+    try:
+        return future.result()
+    except Exception as e:
+        # the worker process died
+        return {'repository': parameters.get('github_repo') or parameters.get('project_path'),
+                'status': 'failed', 'version': None, 'error': u'{}: {}'.format(type(e).__name__, e),
+                'duration': 0, 'output': ''}
+
+
+def main():
+    arguments = docopt(__doc__, version='Github Flow Release 1.0.0')
+    from githubflow_release.release import release, init_log
+    init_log()
+
+    # the command line options override the manifest
+    options = {'github_user': arguments['--github-user'],
+               'github_token': arguments['--github-token'],
+               'cache_dir': arguments['--cache-dir'],
+               'use_cache': False if arguments['--no-cache'] else None,
+               'dry_run': arguments['--dry-run'] or None,
+               'auto_push': arguments['--auto-push'] or None}
+    options = {k: v for k, v in options.items() if v is not None}
+
+    repositories = read_manifest(arguments['<manifest>'], inspect.signature(release).parameters)
+    manager = _shared_rate_limiter_manager()
+    rate_limiter = manager.RateLimiter()
+    try:
+        with ProcessPoolExecutor(max_workers=int(arguments['--jobs'])) as executor:
+            futures = [executor.submit(_release_repository, dict(parameters, **options), rate_limiter)
+                       for parameters in repositories]
+            results = [_result(future, parameters) for future, parameters in zip(futures, repositories)]
+    finally:
+        manager.shutdown()
+
+    print('Summary:')
+    for result in results:
+        print(' {repository}: {status}{version}{error} ({duration:.1f}s)'.format(
+            repository=result['repository'], status=result['status'], duration=result['duration'],
+            version=' {}'.format(result['version']) if result['version'] else '',
+            error=' - {}'.format(result['error']) if result['error'] else ''))
+        if result['output']:
+            print('  ' + result['output'].rstrip('\n').replace('\n', '\n  '))
+    exit(1 if any(r['status'] == 'failed' for r in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+DEFAULT_CACHE_MAX_SIZE = 200 * 1024 * 1024  # in bytes
+SIZE_FILE = 'size'  # total size of the bodies, kept in the cache directory
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'githubflow_release')
+
+
+class HttpCache(object):
+    """
+    On disk cache of the github api responses
+
+    Each entry is stored in 2 files: `<key>.meta` (url, etag, headers) and `<key>.body` (raw body).
+    The files are written in a temporary file and then renamed, so several processes can share the same cache.
+    When the cache grows bigger than `max_size`, the least recently used entries are removed.
+    The total size is kept in a `size` file so it is not computed again by each run: the processes sharing the
+    cache can lose some updates of it, it is only an estimate, computed again when evicting.
+    """
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._size = None  # read from the size file at the first store
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, identity):
+        return hashlib.sha256(u'{}\n{}'.format(identity, url).encode('utf-8')).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], '{}.{}'.format(key, ext))
+
+    def get(self, key):
+        """ return the metadata of an entry (url, etag, last_modified, headers) or None """
+        try:
+            with open(self._path(key, 'meta')) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not os.path.exists(self._path(key, 'body')):
+            return None
+        return meta
+
+    def read_body(self, key):
+        """ read the body of an entry and mark it as recently used """
+        path = self._path(key, 'body')
+        with open(path, 'rb') as f:
+            body = f.read()
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return body
+
+    def store(self, key, meta, body):
+        try:
+            # an entry can be replaced (new etag), only the difference is added to the size
+            previous_size = os.path.getsize(self._path(key, 'body'))
+        except OSError:
+            previous_size = 0
+        try:
+            os.makedirs(os.path.dirname(self._path(key, 'meta')), exist_ok=True)
+            self._write(self._path(key, 'body'), body)
+            self._write(self._path(key, 'meta'), json.dumps(meta).encode('utf-8'))
+        except (IOError, OSError) as e:
+            logging.warning('impossible to write in http cache {}: {}'.format(self.cache_dir, e))
+            return
+        self._added(len(body) - previous_size)
+
+    def _write(self, path, content):
+        tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _entries(self):
+        """ list of (last access, size, key) of all the entries """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if not filename.endswith('.body'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filename[:-len('.body')]))
+        return entries
+
+    def _read_size(self):
+        try:
+            with open(os.path.join(self.cache_dir, SIZE_FILE)) as f:
+                return int(f.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _write_size(self):
+        try:
+            self._write(os.path.join(self.cache_dir, SIZE_FILE), str(self._size).encode('utf-8'))
+        except (IOError, OSError) as e:
+            logging.debug('impossible to write the size of http cache {}: {}'.format(self.cache_dir, e))
+
+    def _added(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = self._read_size()
+            if self._size is None:
+                # new cache (or made by an older version): the only time the whole directory is read
+                self._size = sum(s for _, s, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict()
+            self._write_size()
+
+    def _evict(self):
+        """ remove the least recently used entries until the cache is back to 90% of its max size """
+        entries = sorted(self._entries())
+        self._size = sum(s for _, s, _ in entries)
+        target = self.max_size * 0.9
+        for _, size, key in entries:
+            if self._size <= target:
+                break
+            for ext in ('meta', 'body'):
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+            self._size -= size
+        logging.debug('http cache evicted down to {} bytes'.format(self._size))
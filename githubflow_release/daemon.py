@@ -0,0 +1,333 @@
+"""Github flow release daemon
+
+Keeps a repository, its github client and the pull requests merged and not released yet in memory, kept up to
+date by the github webhooks (pull_request, label and push events), and answers on a local http api:
+
+  GET  /version?release_type=minor      next version
+  GET  /changelog?release_type=minor    changelog of the pull requests not released yet
+  POST /release                         release, json body: {"release_type": "minor", "dry_run": false,
+                                        "hotfix_pr_ids": []}
+  POST /webhook                         github webhooks (the recorded payloads can be posted too)
+  GET  /health
+
+Usage:
+  githubflow_release_daemon (--github-repo <repo>)
+                     [--project-path <DIR>]
+                     [--remote-name <name>]
+                     [--github-user <user>]
+                     [--github-token <token>]
+                     [--base-branch <branch>]
+                     [--debian-changelog]
+                     [--excluded-pr-tag <tags>]...
+                     [--auto-push]
+                     [--no-cache | --cache-dir <DIR>]
+                     [--github-api-url <url>]
+                     [--backend <backend>]
+                     [--pr-discovery <mode>]
+                     [--listen <address>]
+                     [--webhook-secret <secret>]
+  githubflow_release_daemon (-h | --help)
+  githubflow_release_daemon --version
+
+Options:
+  -h --help                  Show this screen.
+  --version                  Show version.
+  --project-path <DIR>       Project path   [default: .]
+  --remote-name <name>       Remote name    [default: upstream]
+  --github-repo <repo>       Github repo (User/Repository)
+  --github-user <user>       Github user
+  --github-token <token>     Github token
+  --base-branch <branch>     Base branch  [default: master]
+  --debian-changelog         Generate debian_changelog
+  --excluded-pr-tag <tags>   PR will be excluded if labelled with the given tag [default: hotfix not_in_changelog] (multiple values accepted)
+  --auto-push                Automatic push release and tags
+  --no-cache                 Do not use the github api cache
+  --cache-dir <DIR>          Github api cache directory (default: ~/.cache/githubflow_release)
+  --github-api-url <url>     Github api url  [default: https://api.github.com]
+  --backend <backend>        Github api used to fetch the PR, 'rest' or 'graphql'  [default: rest]
+  --pr-discovery <mode>      How the merged PR are found at startup, 'scan', 'local', 'search' or 'index'
+                             [default: scan]
+  --listen <address>         Address of the http api  [default: 127.0.0.1:8080]
+  --webhook-secret <secret>  Secret of the github webhooks, to check their signature
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl
+from docopt import docopt
+
+RELEASE_TYPES = ['major', 'minor', 'hotfix']
+
+
+class DaemonError(Exception):
+    pass
+
+
+class ReleaseDaemon(object):
+    """
+    Warm state of the releases of a repository
+
+    The pull requests merged in the base branch and not released yet are found once at startup, then the
+    webhooks keep them up to date: a merged PR is added, its title and labels follow the edits, and the PR
+    are removed once their head is in the release branch. They are found again after a push on the release
+    branch or a forced push on the base branch.
+    All the calls are serialized, the repository is not used by several threads at the same time.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.pending = {}  # number -> PullRequest merged and not released
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        self.refresh()
+
+    def _refresh(self):
+        """ fetch the repository and find the PR not released again """
+        self.manager._update_repository()
+        self.manager._release_index = None
+        # the excluded PR are kept too, their labels can change; they are left out by _pullrequests
+        excluded_pr_tag = self.manager.excluded_pr_tag
+        self.manager.excluded_pr_tag = []
+        try:
+            self.pending = {pr.number: pr for pr in self.manager._get_merged_pullrequest()}
+        finally:
+            self.manager.excluded_pr_tag = excluded_pr_tag
+
+    def _is_released(self, sha):
+        return sha in self.manager._get_release_index()
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+        logging.info('{} PR not released yet'.format(len(self.pending)))
+
+    def handle_event(self, event, payload):
+        """ update the PR not released with a github webhook, returns what has been done """
+        if event == 'push':
+            return self._push_event(payload)
+        with self._lock:
+            if event == 'ping':
+                return 'pong'
+            if event == 'pull_request':
+                return self._pull_request_event(payload)
+            if event == 'label':
+                return self._label_event(payload)
+            return 'ignored'
+
+    def _push_event(self, payload):
+        """
+        a release made elsewhere (push on the release branch) or a rewritten history (forced push on the base
+        branch) needs everything to be computed again. The merges of PR also push on the base branch, they are
+        already known from their pull_request event.
+        The refresh is done in the background, github does not wait long for the answer of a webhook.
+        """
+        ref = payload.get('ref')
+        if ref == 'refs/heads/release' or (ref == 'refs/heads/{}'.format(self.manager.base_branch)
+                                           and payload.get('forced')):
+            threading.Thread(target=self.refresh, daemon=True).start()
+            return 'refresh scheduled'
+        return 'ignored'
+
+    def _pull_request_event(self, payload):
+        from githubflow_release.release import PullRequest
+        raw_pr = payload['pull_request']
+        if raw_pr.get('base', {}).get('ref') != self.manager.base_branch or not raw_pr.get('merged_at'):
+            self.pending.pop(raw_pr['number'], None)
+            return 'ignored'
+        pr = PullRequest(raw_pr)
+        if pr.head_sha1 and self.manager._commit_exists(pr.head_sha1) and self._is_released(pr.head_sha1):
+            self.pending.pop(pr.number, None)
+            return 'released'
+        # new merged PR, or new title/labels of a PR not released
+        self.pending[pr.number] = pr
+        return 'updated'
+
+    def _label_event(self, payload):
+        """ a label of the repository has been renamed or deleted """
+        action = payload.get('action')
+        name = payload['label']['name']
+        if action == 'edited' and 'name' in payload.get('changes', {}):
+            old_name = payload['changes']['name']['from']
+            for pr in self.pending.values():
+                pr._labels = [name if l == old_name else l for l in pr.labels]
+            return 'updated'
+        if action == 'deleted':
+            for pr in self.pending.values():
+                pr._labels = [l for l in pr.labels if l != name]
+            return 'updated'
+        return 'ignored'
+
+    def _pullrequests(self):
+        """ the PR to release, without the excluded ones, the most recent first """
+        excluded = set(self.manager.excluded_pr_tag)
+        return [pr for _, pr in sorted(self.pending.items(), reverse=True) if not excluded.intersection(pr.labels)]
+
+    def _version(self, release_type):
+        if release_type not in RELEASE_TYPES:
+            raise DaemonError('{} is not a known release type'.format(release_type))
+        self.manager.release_type = release_type
+        return self.manager._get_new_version_number()
+
+    def next_version(self, release_type):
+        with self._lock:
+            return self._version(release_type)
+
+    def changelog(self, release_type):
+        with self._lock:
+            version = self._version(release_type)
+            pullrequests = self._pullrequests()
+            return {'version': version,
+                    'changelog': self.manager._generate_changelog(version, pullrequests),
+                    'pull_requests': [{'number': pr.number, 'title': pr.title, 'url': pr.url}
+                                      for pr in pullrequests]}
+
+    def release(self, release_type, dry_run=False, hotfix_pr_ids=None):
+        """ release the PR not released yet (or some hotfix PR), returns the version released """
+        with self._lock:
+            self.manager._update_repository()
+            self.manager._release_index = None
+            version = self._version(release_type)
+            if release_type == 'hotfix':
+                if not hotfix_pr_ids:
+                    raise DaemonError('the hotfix PR are needed for a hotfix')
+                self.manager.hotfix_pr_ids = hotfix_pr_ids
+                pullrequests = self.manager._get_hotfix_pullrequest()
+            else:
+                pullrequests = []
+                for pr in self._pullrequests():
+                    if pr.head_sha1 is None:
+                        # found by the search api, which gives no head: the PR released have been left out by
+                        # the discovery (from the merge commits of the release branch)
+                        pullrequests.append(pr)
+                    elif not self.manager._commit_exists(pr.head_sha1):
+                        # as for the scan, the PR not in the git history are left out
+                        logging.warning("Commit {} of PR {} not found".format(pr.head_sha1, pr.url))
+                    elif not self._is_released(pr.head_sha1):
+                        # the fetch might have brought PR released in the meantime
+                        pullrequests.append(pr)
+            if dry_run:
+                return {'version': version, 'released': False,
+                        'changelog': self.manager._generate_changelog(version, pullrequests)}
+
+            self.manager.files_to_commit = []
+            released = self.manager.release_pull_requests(version, pullrequests)
+            if released and release_type != 'hotfix':
+                # the base branch has been merged in the release branch, the excluded PR are released too
+                excluded = set(self.manager.excluded_pr_tag)
+                for pr in list(self.pending.values()):
+                    if pr in pullrequests or excluded.intersection(pr.labels):
+                        del self.pending[pr.number]
+            self.manager._release_index = None
+            return {'version': released, 'released': released is not None}
+
+
+def _check_signature(secret, body, signature):
+    """ github signs the webhook payloads with the secret (X-Hub-Signature-256 header) """
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or '')
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    daemon = None  # set by serve
+    webhook_secret = None
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _call(self, function, *args, **kwargs):
+        try:
+            return self._send(200, function(*args, **kwargs))
+        except DaemonError as e:
+            return self._send(400, {'error': str(e)})
+        except SystemExit as e:
+            # the release code exits on some errors, the daemon must keep running
+            return self._send(500, {'error': 'release stopped with exit code {}'.format(e.code)})
+        except Exception as e:
+            logging.exception('error on {}'.format(self.path))
+            return self._send(500, {'error': u'{}: {}'.format(type(e).__name__, e)})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        release_type = query.get('release_type', 'minor')
+        if url.path == '/health':
+            return self._send(200, {'pending': len(self.daemon.pending)})
+        if url.path == '/version':
+            return self._call(lambda: {'version': self.daemon.next_version(release_type)})
+        if url.path == '/changelog':
+            return self._call(self.daemon.changelog, release_type)
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/webhook':
+            if self.webhook_secret and not _check_signature(self.webhook_secret, body,
+                                                            self.headers.get('X-Hub-Signature-256')):
+                return self._send(401, {'error': 'invalid signature'})
+            event = self.headers.get('X-GitHub-Event')
+            return self._call(lambda: {'event': event, 'result': self.daemon.handle_event(event, json.loads(body))})
+        if url.path == '/release':
+            params = json.loads(body or b'{}')
+            return self._call(self.daemon.release, params.get('release_type', 'minor'),
+                              dry_run=params.get('dry_run', False), hotfix_pr_ids=params.get('hotfix_pr_ids'))
+        self._send(404, {'error': 'not found'})
+
+
+def serve(daemon, address, webhook_secret=None):
+    host, _, port = address.rpartition(':')
+    handler = type('Handler', (_Handler,), {'daemon': daemon, 'webhook_secret': webhook_secret})
+    server = _Server((host or '127.0.0.1', int(port)), handler)
+    logging.info('listening on {}'.format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    arguments = docopt(__doc__, version='Github Flow Release 1.0.0')
+    from githubflow_release.release import ReleaseManager, init_log, _cache_dir
+    init_log()
+
+    manager = ReleaseManager(path=arguments['--project-path'],
+                             release_type='minor',
+                             remote_name=arguments['--remote-name'],
+                             github_repo=arguments['--github-repo'],
+                             github_user=arguments['--github-user'],
+                             github_token=arguments['--github-token'],
+                             base_branch=arguments['--base-branch'],
+                             generate_debian_changelog=arguments['--debian-changelog'],
+                             hotfix_pr_ids=None,
+                             excluded_pr_tag=arguments['--excluded-pr-tag'],
+                             dry_run=False,
+                             auto_push=arguments['--auto-push'],
+                             cache_dir=_cache_dir(arguments['--cache-dir'], not arguments['--no-cache']),
+                             github_api_url=arguments['--github-api-url'],
+                             backend=arguments['--backend'],
+                             pr_discovery=arguments['--pr-discovery'])
+    daemon = ReleaseDaemon(manager)
+    daemon.warm_up()
+    serve(daemon, arguments['--listen'], arguments['--webhook-secret'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Writer of debian/changelog, producing the same stanza as `dch --newversion`
+
+    package (version) UNRELEASED; urgency=medium
+
+      * entry
+      * another entry
+
+     -- Maintainer Name <email>  Mon, 17 Oct 2026 10:00:00 +0200
+
+"""
+import email.utils
+import os
+import re
+import shutil
+import textwrap
+
+DEFAULT_DISTRIBUTION = 'UNRELEASED'
+DEFAULT_URGENCY = 'medium'
+LINE_WIDTH = 79  # dch wraps the entries at 80 columns, new line included
+HEADER_RE = re.compile(r'^(\S+) \(')
+
+
+class DebianChangelogError(Exception):
+    pass
+
+
+def maintainer_from_env():
+    """ maintainer as dch gets it from the environment, None if it is not set """
+    name = os.environ.get('DEBFULLNAME') or os.environ.get('NAME')
+    mail = os.environ.get('DEBEMAIL') or os.environ.get('EMAIL')
+    if mail:
+        # DEBEMAIL can be 'Name <email>'
+        parsed_name, parsed_mail = email.utils.parseaddr(mail)
+        if parsed_mail and parsed_name:
+            name = name or parsed_name
+            mail = parsed_mail
+    if not name or not mail:
+        return None
+    return u'{} <{}>'.format(name, mail)
+
+
+def render_stanza(package, version, entries, maintainer, date=None,
+                  distribution=DEFAULT_DISTRIBUTION, urgency=DEFAULT_URGENCY):
+    date = date or email.utils.formatdate(localtime=True)
+    lines = [u'{} ({}) {}; urgency={}'.format(package, version, distribution, urgency), u'']
+    for entry in entries:
+        lines.extend(textwrap.wrap(entry, width=LINE_WIDTH, initial_indent=u'  * ', subsequent_indent=u'    ',
+                                   break_long_words=False, break_on_hyphens=False))
+    lines.extend([u'', u' -- {}  {}'.format(maintainer, date), u'', u''])
+    return u'\n'.join(lines)
+
+
+def prepend_stanza(source, destination, version, entries, maintainer, date=None):
+    """
+    write in `destination` a new stanza followed by the content of `source` (text file objects)
+    the package name is the one of the first stanza of `source`
+    """
+    first_line = source.readline()
+    match = HEADER_RE.match(first_line)
+    if not match:
+        raise DebianChangelogError(u'invalid debian changelog, cannot find the package name in "{}"'
+                                   .format(first_line.strip()))
+    destination.write(render_stanza(match.group(1), version, entries, maintainer, date))
+    destination.write(first_line)
+    shutil.copyfileobj(source, destination)
+
+
+def update_changelog(filename, version, entries, maintainer, date=None):
+    """ add a new stanza at the top of a debian changelog file, in one write """
+    tmp_filename = filename + '.tmp'
+    try:
+        with open(filename, encoding='utf-8') as source, open(tmp_filename, 'w', encoding='utf-8') as destination:
+            prepend_stanza(source, destination, version, entries, maintainer, date)
+        shutil.copymode(filename, tmp_filename)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
@@ -0,0 +1,69 @@
+"""
+Fetch of the refs needed by a release only (the base branch, the release branch and the tags), instead of all
+the branches of the remote
+"""
+import logging
+from git.exc import GitCommandError
+
+
+def ls_remote(git, remote, patterns):
+    """ dict ref name -> sha of the refs of a remote matching some patterns (peeled tags excluded) """
+    output = git.ls_remote(remote, *patterns)
+    refs = {}
+    for line in output.splitlines():
+        sha, ref = line.split('\t', 1)
+        if not ref.endswith('^{}'):
+            refs[ref] = sha
+    return refs
+
+
+def local_refs(git, patterns):
+    """ dict ref name -> sha of the local refs matching some patterns """
+    output = git.for_each_ref('--format=%(objectname) %(refname)', *patterns)
+    return dict(reversed(line.split(' ', 1)) for line in output.splitlines())
+
+
+def is_partial_clone(git, remote):
+    """ True if the repository has been cloned with a filter (git clone --filter=...) """
+    for option in ('remote.{}.promisor'.format(remote), 'extensions.partialClone'):
+        try:
+            if git.config('--get', option):
+                return True
+        except GitCommandError:
+            pass  # not set
+    return False
+
+
+def targeted_fetch(git, remote, branches, pull_requests=()):
+    """
+    fetch some branches of a remote (as refs/remotes/<remote>/<branch>) and its tags
+
+    The head of the `pull_requests` (numbers) are fetched too (as refs/remotes/<remote>/pull/<number>), github
+    exposes them as refs/pull/<number>/head.
+
+    `git ls-remote` is used to only fetch the refs that changed: nothing is fetched if the local refs are up to
+    date. The branches that do not exist on the remote are skipped. Returns the list of the refspecs fetched.
+    """
+    wanted = {'refs/heads/{}'.format(b): 'refs/remotes/{}/{}'.format(remote, b) for b in branches}
+    wanted.update({'refs/pull/{}/head'.format(n): 'refs/remotes/{}/pull/{}'.format(remote, n) for n in pull_requests})
+    remote_refs = ls_remote(git, remote, list(wanted) + ['refs/tags/*'])
+    current_refs = local_refs(git, list(wanted.values()) + ['refs/tags'])
+
+    refspecs = []
+    for ref, local_ref in wanted.items():
+        if ref in remote_refs and current_refs.get(local_ref) != remote_refs[ref]:
+            refspecs.append('+{}:{}'.format(ref, local_ref))
+    if any(current_refs.get(ref) != sha for ref, sha in remote_refs.items() if ref.startswith('refs/tags/')):
+        refspecs.append('refs/tags/*:refs/tags/*')
+
+    if not refspecs:
+        logging.info('{} is already up to date'.format(remote))
+        return refspecs
+
+    args = [remote] + refspecs
+    if is_partial_clone(git, remote):
+        # the missing blobs are lazily fetched by git when they are needed
+        args.insert(0, '--filter=blob:none')
+    logging.debug('fetching {}'.format(' '.join(refspecs)))
+    git.fetch(*args)
+    return refspecs
@@ -0,0 +1,333 @@
+import collections
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from githubflow_release.metrics import Metrics
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_TIMEOUT = 60  # in seconds
+BACKOFF_FACTOR = 1  # in seconds, doubled at each retry
+MAX_BACKOFF = 120  # in seconds
+PER_PAGE = 100  # max allowed by github
+PAGE_PREFETCH = 4  # number of pages fetched in advance when paginating
+# when there are less requests than this left in the rate limit (or less than 10% of the limit), they are spread
+# until the reset of the limit
+RATE_LIMIT_LOW_WATERMARK = 50
+
+
+def rate_limit_resource(url):
+    """ github has separate rate limits for the search api, the graphql api and the rest of the api """
+    path = urlparse(url).path
+    if path.endswith('/graphql'):
+        return 'graphql'
+    if '/search/' in path:
+        return 'search'
+    return 'core'
+
+
+class RateLimiter(object):
+    """
+    Keep track of the github rate limits to slow down before being blocked
+
+    The state of each limit ('core', 'search', 'graphql') is updated with the X-RateLimit-* headers of each
+    response, and `pause` is used when github asks us to wait (Retry-After).
+    All the threads using the same client wait together.
+    """
+    def __init__(self):
+        self.limits = {}  # resource -> (remaining, limit, reset epoch timestamp)
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def update(self, resource, response):
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+        resource = response.headers.get('X-RateLimit-Resource', resource)
+        self.set_limit(resource, int(remaining), int(response.headers.get('X-RateLimit-Limit', 0)), int(reset))
+
+    def set_limit(self, resource, remaining, limit, reset):
+        with self._lock:
+            self.limits[resource] = (remaining, limit, reset)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def delay(self, resource):
+        """ number of seconds to wait before the next request on a resource """
+        now = time.time()
+        with self._lock:
+            delay = max(0, self.paused_until - now)
+            if resource not in self.limits:
+                return delay
+            remaining, limit, reset = self.limits[resource]
+            if reset > now:
+                if remaining <= 0:
+                    delay = max(delay, reset - now)
+                elif remaining < min(RATE_LIMIT_LOW_WATERMARK, limit // 10 or RATE_LIMIT_LOW_WATERMARK):
+                    delay = max(delay, (reset - now) / remaining)
+                    # the request we are about to do will consume one
+                    self.limits[resource] = (remaining - 1, limit, reset)
+        return delay
+
+    def wait(self, resource):
+        delay = self.delay(resource)
+        if delay > 0:
+            logging.info('github {} rate limit almost reached, waiting {:.1f}s'.format(resource, delay))
+            time.sleep(delay)
+
+
+class GithubClient(object):
+    """
+    Access to the github api
+
+    All the requests share a pooled keep-alive session. Server errors, connection errors and rate limit
+    errors are retried with an exponential backoff (or after the delay given by github), and the requests are
+    slowed down when the rate limit is close to be reached.
+
+    If a cache is given, the responses are stored with their ETag and the next requests on the same url are
+    conditional (If-None-Match). Github answers 304 when nothing changed, those responses are not counted
+    in the rate limit and the body is read from the cache.
+    """
+    def __init__(self, auth=None, cache=None, pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES,
+                 rate_limiter=None, metrics=None):
+        self.auth = auth
+        self.cache = cache
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.metrics = metrics or Metrics()
+        if auth is not None:
+            # the token is not stored in the cache, only a hash of it
+            credentials = u'{}:{}'.format(auth.username, auth.password).encode('utf-8')
+            self.identity = hashlib.sha256(credentials).hexdigest()
+        else:
+            self.identity = 'anonymous'
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """ do a request, retrying it if github is in error or asks us to slow down """
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+        resource = rate_limit_resource(url)
+        attempt = 0
+        while True:
+            self.rate_limiter.wait(resource)
+            self.metrics.incr('http_requests')
+            if attempt:
+                self.metrics.incr('http_retries')
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.metrics.incr('http_errors')
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning('error while calling {}: {}, retrying in {}s'.format(url, e, delay))
+            else:
+                self.metrics.incr('http_bytes', len(response.content))
+                self.rate_limiter.update(resource, response)
+                if 'X-RateLimit-Remaining' in response.headers:
+                    self.metrics.gauge('rate_limit_remaining.{}'.format(
+                        response.headers.get('X-RateLimit-Resource', resource)),
+                        int(response.headers['X-RateLimit-Remaining']))
+                delay = self._retry_delay(response, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    return response
+                logging.warning('github answered {} to {}, retrying in {}s'.format(response.status_code, url,
+                                                                                   delay))
+                if response.status_code in (403, 429):
+                    # rate limited, the other threads must wait too
+                    self.rate_limiter.pause(delay)
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _backoff(attempt):
+        return min(BACKOFF_FACTOR * 2 ** attempt, MAX_BACKOFF)
+
+    def _retry_delay(self, response, attempt):
+        """ the number of seconds to wait before retrying the request, None if it must not be retried """
+        status = response.status_code
+        if status >= 500:
+            return self._backoff(attempt)
+        if status not in (403, 429):
+            return None
+
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        if response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset'):
+            return max(1, int(response.headers['X-RateLimit-Reset']) - int(time.time()))
+        if status == 429 or 'rate limit' in response.text.lower() or 'abuse' in response.text.lower():
+            # secondary rate limit without any hint
+            return max(60, self._backoff(attempt))
+        # a real 403 (bad credentials, no access...)
+        return None
+
+    def get(self, url):
+        if self.cache is None:
+            return self.request('GET', url)
+
+        key = self.cache.key(url, self.identity)
+        entry = self.cache.get(key)
+        headers = {}
+        if entry:
+            self.metrics.incr('http_conditional_requests')
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.request('GET', url, headers=headers)
+
+        if response.status_code == 304 and entry:
+            logging.debug('{} not modified, read from cache'.format(url))
+            self.metrics.incr('http_not_modified')
+            try:
+                return self._cached_response(url, key, entry, response)
+            except (IOError, OSError):
+                # evicted by another process sharing the cache in the meantime
+                logging.debug('{} is not in the cache anymore, requested again'.format(url))
+                response = self.request('GET', url)
+
+        if response.status_code == 200 and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+            self.cache.store(key, {'url': url,
+                                   'etag': response.headers.get('ETag'),
+                                   'last_modified': response.headers.get('Last-Modified'),
+                                   'headers': dict(response.headers)},
+                             response.content)
+        return response
+
+    def _cached_response(self, url, key, entry, not_modified_response):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        # the rate limit headers of the 304 are more recent than the cached ones
+        for name, value in not_modified_response.headers.items():
+            if name.lower().startswith('x-ratelimit'):
+                response.headers[name] = value
+        response._content = self.cache.read_body(key)
+        response.encoding = 'utf-8'
+        response.from_cache = True
+        return response
+
+    def post(self, url, json):
+        return self.request('POST', url, json=json)
+
+    def paginate(self, url, prefetch=PAGE_PREFETCH, items_key=None, strict=False, first_page=None):
+        """
+        lazy get all the items of a paginated api call, in order
+
+        The first page gives the number of pages (Link rel="last" header), the next `prefetch` pages are then
+        fetched in parallel while the items are consumed. When the consumer stops iterating, the pages not yet
+        requested are cancelled.
+
+        If the pages are not lists, `items_key` is the attribute of the pages holding the items (search api).
+        A page that cannot be retrieved ends the iteration, or raises a PaginationError if `strict`, when a
+        partial list is not acceptable.
+        `first_page` is called with the response of the first page, the iteration stops if it returns False.
+        """
+        url = _with_query(url, per_page=PER_PAGE)
+        response = self._get_page(url)
+        if response is None:
+            _page_failed(url, strict)
+            return
+        if first_page is not None and not first_page(response):
+            return
+        for item in _items(response, items_key):
+            yield item
+
+        last_url = response.links.get('last', {}).get('url')
+        if not last_url:
+            # no 'last' link, either there is only one page or we have to follow the 'next' links
+            next_url = response.links.get('next', {}).get('url')
+            while next_url:
+                response = self._get_page(next_url)
+                if response is None:
+                    _page_failed(next_url, strict)
+                    return
+                for item in _items(response, items_key):
+                    yield item
+                next_url = response.links.get('next', {}).get('url')
+            return
+
+        last_page = int(dict(parse_qsl(urlparse(last_url).query)).get('page', 1))
+        pages = (_with_query(last_url, page=page) for page in range(2, last_page + 1))
+        executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+        futures = collections.deque()
+        try:
+            for page_url in pages:
+                futures.append((page_url, executor.submit(self._get_page, page_url)))
+                if len(futures) < prefetch:
+                    continue
+                for item in self._page_items(futures.popleft(), items_key):
+                    yield item
+            while futures:
+                for item in self._page_items(futures.popleft(), items_key):
+                    yield item
+        except _PageError as e:
+            _page_failed(e.args[0], strict)
+            return
+        finally:
+            for _, future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _get_page(self, url):
+        logging.debug("query github api: %s", url)
+        response = self.get(url)
+        if response.status_code != 200:
+            try:
+                message = response.json().get('message')
+            except ValueError:
+                message = u'{} {}'.format(response.status_code, response.reason)
+            logging.error(u'Impossible to retrieve %s:\n  %s', url, message)
+            return None
+        return response
+
+    @staticmethod
+    def _page_items(page, items_key):
+        url, future = page
+        response = future.result()
+        if response is None:
+            raise _PageError(url)
+        return _items(response, items_key)
+
+
+class PaginationError(Exception):
+    pass
+
+
+class _PageError(Exception):
+    pass
+
+
+def _page_failed(url, strict):
+    if strict:
+        raise PaginationError(u'impossible to retrieve {}'.format(url))
+
+
+def _items(response, items_key):
+    page = response.json()
+    return page[items_key] if items_key else page
+
+
+def _with_query(url, **params):
+    """ set some query parameters of an url """
+    parsed = urlparse(url)
+    query = dict(parse_qsl(parsed.query, keep_blank_values=True))
+    query.update({k: str(v) for k, v in params.items()})
+    return urlunparse(parsed._replace(query=urlencode(query)))
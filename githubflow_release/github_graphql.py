@@ -0,0 +1,109 @@
+import logging
+
+# fields needed to build a PullRequest
+PR_FRAGMENT = """
+fragment pr on PullRequest {
+  number
+  title
+  url
+  headRefOid
+  mergedAt
+  labels(first: 100) { nodes { name } }
+  commits(first: 100) {
+    pageInfo { hasNextPage }
+    nodes { commit { oid } }
+  }
+}
+"""
+
+MERGED_PR_QUERY = """
+query($owner: String!, $name: String!, $base: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: MERGED, baseRefName: $base, first: 100, after: $cursor,
+                 orderBy: {field: CREATED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes { ...pr }
+    }
+  }
+}
+""" + PR_FRAGMENT
+
+PR_BY_NUMBER_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    {aliases}
+  }
+}
+""" + PR_FRAGMENT
+
+
+def graphql_url(api_url):
+    """ the graphql endpoint of a github api (github.com or github enterprise) """
+    api_url = api_url.rstrip('/')
+    if api_url.endswith('/api/v3'):
+        return api_url[:-len('/v3')] + '/graphql'
+    return api_url + '/graphql'
+
+
+class GraphqlError(Exception):
+    pass
+
+
+class GithubGraphqlBackend(object):
+    """
+    Fetch the pull requests with the github graphql api (v4)
+
+    One query returns a page of 100 PRs with their labels and commits, where the rest api needs one call per
+    PR for the labels and another one for the commits.
+    The nodes are given to `make_pr` to build the PullRequest objects.
+    """
+    def __init__(self, github, api_url, repository, make_pr):
+        self.github = github
+        self.url = graphql_url(api_url)
+        self.owner, self.name = repository.split('/', 1)
+        self.make_pr = make_pr
+
+    def _query(self, query, allow_partial=False, **variables):
+        variables.update(owner=self.owner, name=self.name)
+        response = self.github.post(self.url, json={'query': query, 'variables': variables})
+        if response.status_code != 200:
+            raise GraphqlError(response.json().get('message'))
+        result = response.json()
+        errors = result.get('errors')
+        if errors:
+            message = '; '.join(e.get('message', '') for e in errors)
+            if not allow_partial or not (result.get('data') or {}).get('repository'):
+                raise GraphqlError(message)
+            logging.warning(u'github graphql api errors:\n  %s', message)
+        return result['data']['repository']
+
+    def merged_pull_requests(self, base_branch):
+        """ lazy get all the PR merged in base_branch, the most recent first """
+        cursor = None
+        while True:
+            logging.debug("query github graphql api: merged PR after %s", cursor)
+            try:
+                page = self._query(MERGED_PR_QUERY, base=base_branch, cursor=cursor)['pullRequests']
+            except GraphqlError as e:
+                logging.error(u'Impossible to retrieve PR:\n  %s', e)
+                return
+            for node in page['nodes']:
+                yield self.make_pr(node)
+            if not page['pageInfo']['hasNextPage']:
+                return
+            cursor = page['pageInfo']['endCursor']
+
+    def pull_requests(self, numbers, chunk_size=100):
+        """
+        get some PR by number, with one query for each `chunk_size` PR
+
+        the numbers that are not PR (issues, unknown numbers) are skipped
+        """
+        prs = []
+        numbers = [int(n) for n in numbers]
+        for i in range(0, len(numbers), chunk_size):
+            chunk = numbers[i:i + chunk_size]
+            aliases = '\n    '.join('pr{n}: pullRequest(number: {n}) {{ ...pr }}'.format(n=n) for n in chunk)
+            repository = self._query(PR_BY_NUMBER_QUERY.replace('{aliases}', aliases), allow_partial=True)
+            prs.extend(self.make_pr(repository['pr{}'.format(n)]) for n in chunk if repository.get('pr{}'.format(n)))
+        return prs
@@ -0,0 +1,23 @@
+"""
+Git command wrapper counting in the metrics the git subprocesses of a release
+
+It is apart from the metrics, which are also used by githubflow_get_new_version without GitPython.
+"""
+import git
+
+
+class MeteredGit(git.Git):
+    """ git command wrapper counting the git subprocesses and the size of their output """
+    def __init__(self, working_dir, metrics):
+        super(MeteredGit, self).__init__(working_dir)
+        self.metrics = metrics
+
+    def execute(self, command, **kwargs):
+        self.metrics.incr('git_commands')
+        output = super(MeteredGit, self).execute(command, **kwargs)
+        if isinstance(output, (str, bytes)):
+            self.metrics.incr('git_output_bytes', len(output))
+        elif isinstance(output, tuple) and isinstance(output[1], (str, bytes)):
+            # with_extended_output: (status, stdout, stderr)
+            self.metrics.incr('git_output_bytes', len(output[1]))
+        return output
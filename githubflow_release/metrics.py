@@ -0,0 +1,106 @@
+"""
+Timing and accounting of a release run
+
+The github client and the git commands update some counters (requests, 304, bytes, git subprocesses...), and
+the phases of a release are wrapped in spans: each span records its duration and how much the counters moved
+during it. The spans are inclusive, the counters of a nested span are counted in its parent too.
+The spans of the lookups running concurrently (labels) only count what their own thread did, the counters would
+mix the lookups otherwise; their durations add up in the summary, which can be more than the wall time.
+
+The report can be written as json, and a hook (a function called with each span when it ends) can forward the
+spans to another tracing system.
+"""
+import contextlib
+import importlib
+import json
+import logging
+import threading
+import time
+
+
+class Metrics(object):
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.started_at = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.spans = []
+        self._lock = threading.Lock()
+        self._thread = threading.local()  # counters of the thread spans running in each thread
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for counters in getattr(self._thread, 'spans', ()):
+            counters[name] = counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        """ last value of a measure, like the remaining rate limit """
+        with self._lock:
+            self.gauges[name] = value
+
+    @contextlib.contextmanager
+    def span(self, name, thread=False):
+        """ if `thread`, only the counters updated by the current thread are counted in the span """
+        if thread:
+            own_counters = {}
+            self._thread.__dict__.setdefault('spans', []).append(own_counters)
+        else:
+            with self._lock:
+                before = dict(self.counters)
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            if thread:
+                self._thread.spans.pop()  # the spans of a thread are nested
+            with self._lock:
+                if thread:
+                    delta = own_counters
+                else:
+                    delta = {k: v - before.get(k, 0) for k, v in self.counters.items() if v != before.get(k, 0)}
+                span = {'name': name,
+                        'start': round(start - self.started_at, 6),
+                        'duration': round(end - start, 6),
+                        'counters': delta,
+                        'gauges': dict(self.gauges)}
+                self.spans.append(span)
+            if self.hook:
+                try:
+                    self.hook(span)
+                except Exception as e:
+                    # the release must not stop between two phases because of the tracing
+                    logging.warning(u'metrics hook failed on span {}: {}: {}'.format(name, type(e).__name__, e))
+
+    def summary(self):
+        """ the spans aggregated by name (some spans, like the label lookups, happen many times) """
+        phases = {}
+        for span in self.spans:
+            phase = phases.setdefault(span['name'], {'count': 0, 'duration': 0, 'counters': {}})
+            phase['count'] += 1
+            phase['duration'] = round(phase['duration'] + span['duration'], 6)
+            for k, v in span['counters'].items():
+                phase['counters'][k] = phase['counters'].get(k, 0) + v
+        return phases
+
+    def report(self):
+        with self._lock:
+            return {'started_at': self.started_at,
+                    'duration': round(time.time() - self.started_at, 6),
+                    'counters': dict(self.counters),
+                    'gauges': dict(self.gauges),
+                    'phases': self.summary(),
+                    'spans': list(self.spans)}
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+def load_hook(spec):
+    """ the function of a 'module:function' spec """
+    module_name, _, function_name = spec.partition(':')
+    if not function_name:
+        raise ValueError('invalid metrics hook "{}", it should be "module:function"'.format(spec))
+    return getattr(importlib.import_module(module_name), function_name)
@@ -6,6 +6,15 @@ Usage:
                      [--remote-name <name>]
                      [--github-user <user>]
                      [--github-token <token>]
+                     [--no-cache | --cache-dir <DIR>]
+                     [--fetch-mode <mode>]
+                     [--tag-source <source>]
+                     [--metrics-file <FILE>]
+  githubflow_get_new_version --pending (--github-repo <repo>)
+                     [--project-path <DIR>]
+                     [--remote-name <name>]
+                     [--base-branch <branch>]
+                     [--excluded-pr-tag <tags>]...
   githubflow_get_new_version (-h | --help)
   githubflow_get_new_version --version
 
@@ -17,19 +26,65 @@ Options:
   --remote-name <name>      Remote name    [default: upstream]
   --github-user <user>      Github user
   --github-token <token>    Github token
+  --no-cache                Do not use the github api cache
+  --cache-dir <DIR>         Github api cache directory (default: ~/.cache/githubflow_release)
+  --fetch-mode <mode>       What is fetched from the remote, 'all' (all the branches and tags) or 'targeted' (only
+                            the tags, skipped if they did not change)  [default: all]
+  --tag-source <source>     Where the last version is read, 'describe' (fetch the remote and get the last tag of
+                            the history), 'remote' (highest version of the remote tags, without fetching) or
+                            'local' (highest version of the local tags)  [default: describe]
+  --metrics-file <FILE>     Write the timing and the number of git commands in a json file
+  --pending                 Display the PR not released yet, from the local PR index (no network access)
+  --github-repo <repo>      Github repo (User/Repository)
+  --base-branch <branch>    Base branch  [default: master]
+  --excluded-pr-tag <tags>  PR will be excluded if labelled with the given tag [default: hotfix not_in_changelog] (multiple values accepted)
 """
+import logging
 from docopt import docopt
-from githubflow_release.release import new_version
+from githubflow_release.version_index import TAG_SOURCES, next_version
 
 
 def main():
     arguments = docopt(__doc__, version='Github Flow Release 1.0.0')
 
-    print(new_version(project_path=arguments['--project-path'],
-                       release_type=arguments['--release-type'],
-                       remote_name=arguments['--remote-name'],
-                       github_user=arguments['--github-user'],
-                       github_token=arguments['--github-token']))
+    if arguments['--pending']:
+        from githubflow_release.release import pending_pull_requests
+        print(pending_pull_requests(project_path=arguments['--project-path'],
+                                    remote_name=arguments['--remote-name'],
+                                    github_repo=arguments['--github-repo'],
+                                    base_branch=arguments['--base-branch'],
+                                    excluded_pr_tag=arguments['--excluded-pr-tag']), end='')
+        return
+
+    if arguments['--tag-source'] not in TAG_SOURCES:
+        logging.fatal('{} is not a known tag source'.format(arguments['--tag-source']))
+        exit(2)
+
+    metrics = None
+    if arguments['--metrics-file']:
+        # imports GitPython, only done when the metrics are asked for
+        from githubflow_release.metrics import Metrics
+        metrics = Metrics()
+    try:
+        if arguments['--tag-source'] != 'describe':
+            # fast path, git and requests are not even imported
+            remote_name = arguments['--remote-name'] if arguments['--tag-source'] == 'remote' else None
+            print(next_version(arguments['--project-path'], arguments['--release-type'], remote_name, metrics))
+            return
+
+        from githubflow_release.release import new_version
+        print(new_version(project_path=arguments['--project-path'],
+                           release_type=arguments['--release-type'],
+                           remote_name=arguments['--remote-name'],
+                           github_user=arguments['--github-user'],
+                           github_token=arguments['--github-token'],
+                           cache_dir=arguments['--cache-dir'],
+                           use_cache=not arguments['--no-cache'],
+                           fetch_mode=arguments['--fetch-mode'],
+                           metrics=metrics))
+    finally:
+        if metrics is not None:
+            metrics.write(arguments['--metrics-file'])
 
 
 if __name__ == '__main__':
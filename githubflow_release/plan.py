@@ -0,0 +1,41 @@
+"""
+Release plan: what a release is going to do (version, pull requests), saved by a dry run and replayed later
+
+The plan also records the tips of the remote branches it has been made from. The release made from a plan is
+refused if they have moved, since the pull requests found would not be the same anymore.
+The plan is an indented json file, it can be edited (to remove a pull request or fix a title for example).
+"""
+import json
+
+PLAN_FORMAT = 1
+PLAN_FIELDS = ['format', 'version', 'release_type', 'github_repo', 'base_branch', 'tips', 'pull_requests']
+
+
+class ReleasePlanError(Exception):
+    pass
+
+
+def write_plan(filename, plan):
+    with open(filename, 'w') as f:
+        json.dump(dict(plan, format=PLAN_FORMAT), f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def read_plan(filename):
+    try:
+        with open(filename) as f:
+            plan = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        raise ReleasePlanError(u'impossible to read the release plan {}: {}'.format(filename, e))
+    missing = [field for field in PLAN_FIELDS if field not in plan]
+    if missing:
+        raise ReleasePlanError(u'invalid release plan {}, missing {}'.format(filename, ', '.join(missing)))
+    if plan['format'] != PLAN_FORMAT:
+        raise ReleasePlanError(u'release plan {} has an unknown format {}'.format(filename, plan['format']))
+    return plan
+
+
+def moved_tips(plan, current_tips):
+    """ list of (ref, planned tip, current tip) of the refs that have moved since the plan was made """
+    return [(ref, tip, current_tips.get(ref)) for ref, tip in sorted(plan['tips'].items())
+            if current_tips.get(ref) != tip]
@@ -0,0 +1,86 @@
+"""
+Git operations made on objects and refs only, without touching the working tree or the index
+"""
+import os
+import uuid
+from git.exc import GitCommandError
+
+MERGE_TREE_MIN_VERSION = (2, 38)  # git merge-tree --write-tree
+CHERRY_PICK_MIN_VERSION = (2, 40)  # git merge-tree --merge-base
+
+
+class PlumbingError(Exception):
+    pass
+
+
+def merge_tree(git, ours, theirs, merge_base=None):
+    """ tree of the merge of 2 commits """
+    args = ['--write-tree', '--no-messages']
+    if merge_base:
+        args.append('--merge-base={}'.format(merge_base))
+    try:
+        output = git.merge_tree(*(args + [ours, theirs]))
+    except GitCommandError as e:
+        raise PlumbingError('conflict while merging {} into {}: {}'.format(theirs, ours, e))
+    return output.splitlines()[0]
+
+
+def commit_tree(git, tree, parents, message, env=None):
+    args = [tree]
+    for parent in parents:
+        args.extend(['-p', parent])
+    args.extend(['-m', message])
+    return git.commit_tree(*args, env=env or {})
+
+
+def update_ref(git, ref, new, old=None):
+    """ move a ref, failing if it is not at `old` anymore """
+    git.update_ref(ref, new, old or '')
+
+
+def merge_message(source, destination):
+    """ message of a merge commit, as `git merge` makes it (the destination is omitted for master) """
+    if destination == 'master':
+        return "Merge branch '{}'".format(source)
+    return "Merge branch '{}' into {}".format(source, destination)
+
+
+def no_ff_merge(git, branch, other, other_name):
+    """
+    equivalent of `git merge --no-ff other` on `branch` (a branch name), the new commit is returned
+    """
+    ref = 'refs/heads/{}'.format(branch)
+    tip = git.rev_parse(ref)
+    other_tip = git.rev_parse(other)
+    tree = merge_tree(git, tip, other_tip)
+    commit = commit_tree(git, tree, [tip, other_tip], merge_message(other_name, branch))
+    update_ref(git, ref, commit, tip)
+    return commit
+
+
+def cherry_pick(git, onto, commit):
+    """ equivalent of `git cherry-pick -x commit` on top of the commit `onto`, the new commit is returned """
+    commit_info = git.log('-1', '--format=%P%x00%an%x00%ae%x00%ad%x00%B', '--date=raw', commit)
+    parents, author_name, author_email, author_date, message = commit_info.split('\x00', 4)
+    tree = merge_tree(git, onto, commit, merge_base=parents.split()[0])
+    message = u'{}\n\n(cherry picked from commit {})\n'.format(message.rstrip('\n'), commit)
+    return commit_tree(git, tree, [onto], message, env={'GIT_AUTHOR_NAME': author_name,
+                                                        'GIT_AUTHOR_EMAIL': author_email,
+                                                        'GIT_AUTHOR_DATE': author_date})
+
+
+def commit_files(git, git_dir, parent, blobs, message):
+    """
+    commit on top of `parent` some files already stored in the object database (dict path -> blob sha)
+    a temporary index is used, the index of the repository is not changed
+    """
+    env = {'GIT_INDEX_FILE': os.path.join(git_dir, 'githubflow_release_index_{}'.format(uuid.uuid4()))}
+    try:
+        git.read_tree(parent, env=env)
+        for path, blob in blobs.items():
+            git.update_index('--add', '--cacheinfo', '100644,{},{}'.format(blob, path), env=env)
+        tree = git.write_tree(env=env)
+    finally:
+        if os.path.exists(env['GIT_INDEX_FILE']):
+            os.remove(env['GIT_INDEX_FILE'])
+    return commit_tree(git, tree, [parent], message)
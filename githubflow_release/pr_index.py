@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pull_requests (
+    repository TEXT NOT NULL,
+    base_branch TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    title TEXT,
+    url TEXT,
+    head_sha1 TEXT,
+    merged_at TEXT,
+    updated_at TEXT,
+    labels TEXT,
+    commits_url TEXT,
+    released_in TEXT,
+    PRIMARY KEY (repository, base_branch, number)
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    repository TEXT NOT NULL,
+    base_branch TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (repository, base_branch)
+);
+"""
+
+PR_FIELDS = ['number', 'title', 'url', 'head_sha1', 'merged_at', 'updated_at', 'labels', 'commits_url', 'released_in']
+
+
+class PullRequestIndex(object):
+    """
+    Local store of the PR of a repository, to only ask github for the PR updated since the last release
+
+    For each `github_repo` + `base_branch`, the index keeps the PR already seen (and the tag they have been
+    released in) and a watermark: the last 'updated_at' date of the PR seen.
+    All the changes of a release are written in one transaction.
+    """
+    def __init__(self, path, repository, base_branch):
+        self.path = path
+        self.repository = repository
+        self.base_branch = base_branch
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # the daemon uses the index from its http threads, it serializes the calls
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def watermark(self):
+        """ 'updated_at' date of the most recently updated PR seen, None if the index is empty """
+        row = self._connection.execute('SELECT updated_at FROM watermarks WHERE repository = ? AND base_branch = ?',
+                                       (self.repository, self.base_branch)).fetchone()
+        return row['updated_at'] if row else None
+
+    def pending(self):
+        """ the merged PR not released yet, as dicts, the most recent first """
+        rows = self._connection.execute('SELECT * FROM pull_requests '
+                                        'WHERE repository = ? AND base_branch = ? '
+                                        'AND merged_at IS NOT NULL AND released_in IS NULL '
+                                        'ORDER BY number DESC',
+                                        (self.repository, self.base_branch)).fetchall()
+        return [_to_dict(row) for row in rows]
+
+    def update(self, pull_requests, watermark, released):
+        """
+        store in one transaction:
+        * pull_requests: the PR seen, as dicts with the PR_FIELDS keys
+        * watermark: the new watermark (not changed if None)
+        * released: dict number -> tag of the PR released (the PR already marked keep their tag)
+        """
+        with self._connection:
+            for pr in pull_requests:
+                self._connection.execute('INSERT OR REPLACE INTO pull_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '
+                                         '(SELECT released_in FROM pull_requests '
+                                         ' WHERE repository = ? AND base_branch = ? AND number = ?))',
+                                         (self.repository, self.base_branch, pr['number'], pr['title'], pr['url'],
+                                          pr['head_sha1'], pr['merged_at'], pr['updated_at'],
+                                          json.dumps(pr['labels']), pr['commits_url'],
+                                          self.repository, self.base_branch, pr['number']))
+            for number, tag in released.items():
+                self._connection.execute('UPDATE pull_requests SET released_in = COALESCE(released_in, ?) '
+                                         'WHERE repository = ? AND base_branch = ? AND number = ?',
+                                         (tag, self.repository, self.base_branch, number))
+            if watermark:
+                self._connection.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)',
+                                         (self.repository, self.base_branch, watermark))
+
+
+def _to_dict(row):
+    pr = {field: row[field] for field in PR_FIELDS}
+    pr['labels'] = json.loads(pr['labels']) if pr['labels'] is not None else None
+    return pr
@@ -0,0 +1,91 @@
+import logging
+import os
+from git.exc import GitCommandError
+
+
+class ReachabilityIndex(object):
+    """
+    Set of all the commits reachable from a git ref (usually <remote>/release)
+
+    The set is built with one `git rev-list` (which uses the commit-graph file when the repository has one)
+    and is stored in `cache_file` along with the tip it was computed for.
+    On the next run, if the ref has not moved the stored set is reused as is, and if the ref has only moved
+    forward only the new commits are walked.
+    """
+    def __init__(self, git, ref, cache_file=None):
+        self.git = git
+        self.ref = ref
+        self.cache_file = cache_file
+        self.tip = None
+        self._commits = set()
+
+    def __contains__(self, sha):
+        return sha in self._commits
+
+    def __len__(self):
+        return len(self._commits)
+
+    def load(self):
+        """ build the index, reusing the cached one if possible """
+        try:
+            self.tip = self.git.rev_parse('--verify', '{}^{{commit}}'.format(self.ref))
+        except GitCommandError:
+            logging.warning('{} does not exist, no commit is considered as released'.format(self.ref))
+            self.tip = None
+            self._commits = set()
+            return self
+
+        cached_tip, cached_commits = self._read_cache()
+        if cached_tip == self.tip:
+            logging.debug('reachability index of {} is up to date ({} commits)'.format(self.ref, len(cached_commits)))
+            self._commits = cached_commits
+            return self
+
+        if cached_tip and self._is_ancestor(cached_tip, self.tip):
+            logging.debug('updating reachability index of {} from {}'.format(self.ref, cached_tip))
+            cached_commits.update(self._rev_list(self.tip, '^' + cached_tip))
+            self._commits = cached_commits
+        else:
+            logging.debug('building reachability index of {}'.format(self.ref))
+            self._commits = set(self._rev_list(self.tip))
+
+        self._write_cache()
+        return self
+
+    def _rev_list(self, *revs):
+        return self.git.rev_list(*revs).split()
+
+    def _is_ancestor(self, ancestor, descendant):
+        try:
+            self.git.merge_base('--is-ancestor', ancestor, descendant)
+            return True
+        except GitCommandError:
+            # not an ancestor, or the cached tip does not exist anymore
+            return False
+
+    def _read_cache(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return None, set()
+        try:
+            with open(self.cache_file) as f:
+                content = f.read().split()
+        except (IOError, OSError) as e:
+            logging.warning('impossible to read reachability cache {}: {}'.format(self.cache_file, e))
+            return None, set()
+        if not content:
+            return None, set()
+        return content[0], set(content[1:])
+
+    def _write_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                f.write(self.tip + '\n')
+                f.write('\n'.join(self._commits))
+                f.write('\n')
+            os.replace(tmp_file, self.cache_file)
+        except (IOError, OSError) as e:
+            logging.warning('impossible to write reachability cache {}: {}'.format(self.cache_file, e))
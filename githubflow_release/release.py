@@ -1,59 +1,241 @@
 #!/usr/bin/env python
 import uuid
+import collections
+import io
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 import git
 from git.exc import GitCommandError
+from git.objects import Blob
+from gitdb import IStream
 import requests
 import semver
 import logging
-import sys
-
-os.environ['LC_ALL'] = 'en_US'
-os.environ['GIT_PYTHON_TRACE'] = '1'  # can be 0 (no trace), 1 (git commands) or full (git commands + git output)
+from githubflow_release.cache import HttpCache, default_cache_dir
+from githubflow_release.debian_changelog import update_changelog, prepend_stanza, maintainer_from_env
+from githubflow_release.fetch import targeted_fetch
+from githubflow_release.github import GithubClient, PaginationError, DEFAULT_POOL_SIZE, DEFAULT_MAX_RETRIES
+from githubflow_release.metered_git import MeteredGit
+from githubflow_release.metrics import Metrics, load_hook
+from githubflow_release.github_graphql import GithubGraphqlBackend, GraphqlError
+from githubflow_release.plan import read_plan, write_plan, moved_tips, ReleasePlanError
+from githubflow_release.plumbing import (no_ff_merge, cherry_pick, commit_files, update_ref,
+                                         MERGE_TREE_MIN_VERSION, CHERRY_PICK_MIN_VERSION)
+from githubflow_release.pr_index import PullRequestIndex
+from githubflow_release.reachability import ReachabilityIndex
+from githubflow_release.version_index import next_version
 
 
 # TODO param this
 RELEASE_BRANCH = 'release'
 GITHUB_API_URL = 'https://api.github.com'
+BACKENDS = ['rest', 'graphql']
+FETCH_MODES = ['all', 'targeted']
+# how the merged PR are found:
+#  - scan: go through the closed PR on github until 10 successive ones are already released
+#  - local: read the PR numbers in the merge commits of <remote>/<base> that are not in <remote>/release
+#  - search: search the PR merged in <base> since the last release (falls back to scan if it is not possible)
+#  - index: only get the PR updated since the last release, the others are in a local index
+PR_DISCOVERY_MODES = ['scan', 'local', 'search', 'index']
+MAX_LISTED_PR_COMMITS = 250  # github does not list more commits for a PR
+SEARCH_MAX_RESULTS = 1000  # the search api does not give more results
+SEARCH_DATE_MARGIN = 24 * 3600  # in seconds, between the commit dates of git and the merge dates of github
+# subjects of the commits made by github when merging a PR ("Merge pull request #N ...", "Title (#N)" for squash)
+MERGE_COMMIT_PR_RE = re.compile(r'^Merge pull request #(\d+) ')
+SQUASH_COMMIT_PR_RE = re.compile(r'\(#(\d+)\)$')
+PR_COMMITS_URL_RE = re.compile(r'/pulls/(\d+)/commits$')
 
 
 class PullRequest(object):
+    """
+    The fields of a github PR needed for a release
+
+    The PR are kept during the whole scan of the closed PR, which can go through thousands of them: only the
+    needed fields are kept (not the github payload) and there is no __dict__.
+    """
+    __slots__ = ('number', 'title', 'url', 'head_sha1', 'merged_at', 'is_merged', 'updated_at', 'labels_url',
+                 '_labels', 'commits_url', 'commits', 'nb_commits')
+
     def __init__(self, github_api_response):
+        self.number = github_api_response['number']
         self.title = github_api_response['title']
         self.url = github_api_response['html_url']
         self.head_sha1 = github_api_response['head']['sha']
         # we consider that if the pr has a merged_at date, it has been merged
-        self.is_merged = github_api_response['merged_at'] is not None
-        self.raw_response = github_api_response
+        self.merged_at = github_api_response['merged_at']
+        self.is_merged = self.merged_at is not None
+        self.updated_at = github_api_response.get('updated_at')
+        self.labels_url = github_api_response['_links']['issue']['href'] + '/labels'
         logging.debug(u'pr: {} -- {}'.format(self.title, self.url))
-        self._labels = None
+        # the labels are in the payload of the pulls api, we only need to fetch them if they are missing
+        if 'labels' in github_api_response:
+            self._labels = [l['name'] for l in github_api_response['labels']]
+        else:
+            self._labels = None
         self.commits_url = github_api_response['commits_url']
-
-    def fetch_labels(self, auth):
+        self.commits = None  # sha of the commits, if they are already known
+        self.nb_commits = github_api_response.get('commits')  # only given when the PR is fetched alone
+
+    @classmethod
+    def from_graphql(cls, node, commits_url):
+        """ build a PullRequest from a node of the graphql api, labels and commits included """
+        pr = cls.__new__(cls)
+        pr.number = node['number']
+        pr.title = node['title']
+        pr.url = node['url']
+        pr.head_sha1 = node['headRefOid']
+        pr.merged_at = node['mergedAt']
+        pr.is_merged = pr.merged_at is not None
+        pr.updated_at = None
+        pr.labels_url = _labels_url(commits_url)
+        logging.debug(u'pr: {} -- {}'.format(pr.title, pr.url))
+        pr._labels = [l['name'] for l in node['labels']['nodes']]
+        pr.commits_url = commits_url
+        commits = node['commits']
+        # if the PR has too many commits they will be fetched with the rest api
+        pr.commits = None if commits['pageInfo']['hasNextPage'] else [c['commit']['oid'] for c in commits['nodes']]
+        pr.nb_commits = None
+        return pr
+
+    @classmethod
+    def from_search(cls, item, commits_url):
+        """ build a PullRequest from a result of the search api (merged PR only), labels included """
+        pr = cls.__new__(cls)
+        pr.number = item['number']
+        pr.title = item['title']
+        pr.url = item['html_url']
+        pr.head_sha1 = None  # not given by the search api
+        pr.merged_at = item.get('pull_request', {}).get('merged_at')
+        pr.is_merged = True
+        pr.updated_at = item.get('updated_at')
+        pr.labels_url = _labels_url(commits_url)
+        logging.debug(u'pr: {} -- {}'.format(pr.title, pr.url))
+        pr._labels = [l['name'] for l in item['labels']]
+        pr.commits_url = commits_url
+        pr.commits = None
+        pr.nb_commits = None
+        return pr
+
+    @classmethod
+    def from_index(cls, indexed_pr):
+        """ build a PullRequest from an entry of the local PR index """
+        pr = cls.__new__(cls)
+        pr.number = indexed_pr['number']
+        pr.title = indexed_pr['title']
+        pr.url = indexed_pr['url']
+        pr.head_sha1 = indexed_pr['head_sha1']
+        pr.merged_at = indexed_pr['merged_at']
+        pr.is_merged = pr.merged_at is not None
+        pr.updated_at = indexed_pr['updated_at']
+        pr.labels_url = _labels_url(indexed_pr['commits_url'])
+        pr._labels = indexed_pr['labels']
+        pr.commits_url = indexed_pr['commits_url']
+        pr.commits = None
+        pr.nb_commits = None
+        return pr
+
+    def to_index(self):
+        """ the fields stored in the local PR index """
+        return {'number': self.number,
+                'title': self.title,
+                'url': self.url,
+                'head_sha1': self.head_sha1,
+                'merged_at': self.merged_at,
+                'updated_at': self.updated_at,
+                'labels': self._labels,
+                'commits_url': self.commits_url}
+
+    @property
+    def labels(self):
+        """ labels already known, without calling github """
+        return self._labels or []
+
+    def fetch_labels(self, github):
         """ call github to fetch the labels of the pr """
-        if not self._labels:
-            label_query = self.raw_response['_links']['issue']['href'] + '/labels'
-            self._labels = [r['name'] for r in requests.get(label_query, auth=auth).json()]
+        if self._labels is None:
+            with github.metrics.span('labels', thread=True):
+                self._labels = [r['name'] for r in github.get(self.labels_url).json()]
         return self._labels
 
 
+def _is_done(future):
+    """ no label lookup, or a finished one """
+    return future is None or future.done()
+
+
+def _labels_resolved(entry):
+    """ wait for the label lookup of a (pr, state, future), its errors are raised here """
+    pr, state, future = entry
+    if future is not None:
+        future.result()
+    return pr, state
+
+
+def _labels_url(commits_url):
+    """ the labels of a PR are the ones of its issue: .../pulls/<n>/commits -> .../issues/<n>/labels """
+    return PR_COMMITS_URL_RE.sub(r'/issues/\1/labels', commits_url)
+
+
 class ReleaseManager(object):
     def __init__(self, path, release_type, remote_name, github_repo, github_user, github_token,
-                 base_branch, generate_debian_changelog, hotfix_pr_ids, excluded_pr_tag, dry_run, auto_push=None):
+                 base_branch, generate_debian_changelog, hotfix_pr_ids, excluded_pr_tag, dry_run, auto_push=None,
+                 cache_dir=None, http_pool_size=DEFAULT_POOL_SIZE, http_max_retries=DEFAULT_MAX_RETRIES,
+                 github_api_url=GITHUB_API_URL, backend='rest', pr_discovery='scan', no_checkout=False,
+                 fetch_mode='all', git_trace=None, metrics=None, rate_limiter=None, plan_in=None, plan_out=None):
         self.generate_debian_changelog = generate_debian_changelog
         self.excluded_pr_tag = excluded_pr_tag
         self.release_type = release_type
+        self.last_tag = None  # set when the new version is computed
         self.project_path = path
+        self.metrics = metrics or Metrics()
         self.repo = git.Repo(path)
+        # all the git commands go through this wrapper, to count them
+        self.repo.git = MeteredGit(self.repo.working_dir, self.metrics)
         self.git = self.repo.git
+        # the git output is parsed, it must not be translated
+        self.git.update_environment(LC_ALL='en_US')
+        if git_trace:
+            # can be 1 (git commands) or full (git commands + git output)
+            git.Git.GIT_PYTHON_TRACE = git_trace
         self.remote_name = remote_name
         self.base_branch = base_branch
         if github_user and github_token:
             self.github_auth = requests.auth.HTTPBasicAuth(github_user, github_token)
         else:
             self.github_auth = None
+        # cache_dir=None deactivates the http cache
+        self.github = GithubClient(self.github_auth,
+                                   cache=HttpCache(cache_dir) if cache_dir else None,
+                                   pool_size=http_pool_size,
+                                   max_retries=http_max_retries,
+                                   rate_limiter=rate_limiter,
+                                   metrics=self.metrics)
+        self.github_api_url = github_api_url.rstrip('/')
+        if backend not in BACKENDS:
+            logging.fatal('{} is not a known backend'.format(backend))
+            exit(2)
+        self.backend = backend
+        if pr_discovery not in PR_DISCOVERY_MODES:
+            logging.fatal('{} is not a known PR discovery mode'.format(pr_discovery))
+            exit(2)
+        self.pr_discovery = pr_discovery
+        if fetch_mode not in FETCH_MODES:
+            logging.fatal('{} is not a known fetch mode'.format(fetch_mode))
+            exit(2)
+        self.fetch_mode = fetch_mode
+        self.http_pool_size = http_pool_size
         self.hotfix_pr_ids = hotfix_pr_ids or []
         self.dry_run = dry_run
+        self.plan_in = plan_in
+        self.plan_out = plan_out
+        min_version = CHERRY_PICK_MIN_VERSION if release_type == 'hotfix' else MERGE_TREE_MIN_VERSION
+        if no_checkout and self.git.version_info < min_version:
+            logging.warning('git {} is too old to release without checkout, the branches will be checked out'
+                            .format('.'.join(str(v) for v in self.git.version_info)))
+            no_checkout = False
+        self.no_checkout = no_checkout
 
         # TODO get the remote repos to call (based on git remote -v ?)
         self.github_repository = github_repo
@@ -66,49 +248,110 @@ class ReleaseManager(object):
         self.tag_name_format = 'v{version}'  # can be formated with {version}
         self.tag_footer_format = ''
         self.auto_push = auto_push
+        self._release_index = None
+        self._graphql = None
+        self._pr_index = None
+        self._pr_index_update = None  # what the index discovery found, stored once the release is published
 
     def update_and_get_new_version(self):
         logging.info("making {}".format(self.release_type))
-        self._update_repository()
-        version = self._get_new_version_number()
+        with self.metrics.span('fetch'):
+            self._update_repository()
+        with self.metrics.span('version'):
+            version = self._get_new_version_number()
         logging.info("new tag is {}".format(version))
         return version
 
     def _doit(self):
-        version = self.update_and_get_new_version()
+        """ the version released is returned, None if nothing has been released """
+        if self.plan_in:
+            version, pullrequests = self._read_plan()
+        else:
+            version = self.update_and_get_new_version()
+            with self.metrics.span('pr_discovery'):
+                pullrequests = self._get_pull_requests()
+        return self.release_pull_requests(version, pullrequests)
+
+    def release_pull_requests(self, version, pullrequests):
+        """ release some PR already found (changelog, git branches and tag, publication) """
+        if not pullrequests:
+            logging.warning('no changes detected, no release to do')
+            return None
+        if self.plan_out:
+            self._write_plan(version, pullrequests)
 
-        pullrequests = self._get_pull_requests()
         changelog = self._generate_changelog(version, pullrequests)
         if self.dry_run:
             print('Changelog:')
             print(changelog)
-            sys.exit(0)
-
-        tmp_branch = self._make_git_release(version, pullrequests)
-        if self.release_type == 'hotfix':
-            self._apply_commit(tmp_branch, pullrequests)
-
-        self._publish(version, tmp_branch, changelog)
+            return None
+
+        with self.metrics.span('git_release'):
+            if self.release_type == 'hotfix':
+                # all the commits are needed before any branch is created
+                self._fetch_commits(pullrequests)
+            tmp_branch = self._make_git_release(version, pullrequests)
+            if self.release_type == 'hotfix':
+                self._apply_commit(tmp_branch, pullrequests)
+
+        with self.metrics.span('publish'):
+            self._publish(version, tmp_branch, changelog)
+            self._update_pr_index(self.tag_name_format.format(version=version))
+        return version
 
     def release_or_hotfix(self):
-        self._doit()
+        return self._doit()
+
+    def _get_commits(self, pr):
+        """ sha of the commits of a PR, the oldest first """
+        if pr.commits is not None:
+            return pr.commits
+        try:
+            commits = [commit['sha'] for commit in self.github.paginate(pr.commits_url, strict=True)]
+        except PaginationError as e:
+            logging.error(u'Impossible to retrieve the commits of PR {}: {}'.format(pr.url, e))
+            exit(1)
+        if pr.nb_commits and len(commits) < pr.nb_commits:
+            logging.error('github only lists {} of the {} commits of PR {}'.format(len(commits), pr.nb_commits,
+                                                                                   pr.url))
+            exit(1)
+        if len(commits) >= MAX_LISTED_PR_COMMITS:
+            # the number of commits is not always known (graphql), the list is truncated by github at this size
+            logging.error('PR {} has too many commits, github does not list more than {}, the hotfix must be '
+                          'done by hand'.format(pr.url, MAX_LISTED_PR_COMMITS))
+            exit(1)
+        return commits
+
+    def _fetch_commits(self, pullrequests):
+        """ get the commits of the PR not known yet, concurrently. Stops the release if some are missing """
+        with ThreadPoolExecutor(max_workers=self.http_pool_size) as executor:
+            for pr, commits in zip(pullrequests, executor.map(self._get_commits, pullrequests)):
+                pr.commits = commits
 
     def _apply_commit(self, tmp_branch, pullrequests):
+        # the commits are picked in one go, in the order of the PR
+        commits = [sha for pr in pullrequests for sha in pr.commits]
+
+        if self.no_checkout:
+            old_tip = tip = tmp_branch.commit.hexsha
+            for commit_sha in commits:
+                tip = cherry_pick(self.git, tip, commit_sha)
+            update_ref(self.git, tmp_branch.path, tip, old_tip)
+            return
+
         tmp_branch.checkout()
-        for pr in pullrequests:
-            github_response = requests.get(pr.commits_url, auth=self.github_auth)
-            commits = github_response.json()
-            for commit in commits:
-                commit_sha = commit['sha']
-                self.git.execute(['git', 'cherry-pick', '-x', commit_sha])
+        self.git.execute(['git', 'cherry-pick', '-x'] + commits)
 
-    def _get_new_version_number(self):
+    def _describe_last_tag(self):
         try:
-            self.last_tag = self.git.describe("--tags", abbrev=0)
+            return self.git.describe("--tags", abbrev=0)
         except GitCommandError as e:
             logging.debug('impossible to retrieve tags: {}'.format(e))
             logging.warning('impossible to retrieve tags, we assume there is none')
-            self.last_tag = '0.0.0'
+            return '0.0.0'
+
+    def _get_new_version_number(self):
+        self.last_tag = self._describe_last_tag()
 
         # some tags might have a leading 'v', we remove it to get a real semver
         last_tag = self.last_tag.strip('v')
@@ -125,86 +368,337 @@ class ReleaseManager(object):
 
     def _closed_pr_generator(self):
         # lazy get all closed PR ordered by last updated
-        page = 1
-        while True:
-            query = "{host}/repos/{repo}/pulls?" \
-                    "state=closed&base={base_branch}&sort=newest&direction=desc&page={page}"\
-                    .format(host=GITHUB_API_URL,
-                            repo=self.github_repository,
-                            base_branch=self.base_branch,
-                            latest_tag=self.last_tag,
-                            page=page)
-            logging.debug("query github api: %s", query)
-            github_response = requests.get(query, auth=self.github_auth)
-
-            if github_response.status_code != 200:
-                message = github_response.json()['message']
-                logging.error(u'Impossible to retrieve PR:\n  %s', message)
-                return
-
-            closed_pr = github_response.json()
-            if not closed_pr:
-                logging.debug("Reached end of PR list")
-                return
-
-            for pr in closed_pr:
-                yield pr
-
-            page += 1
+        query = "{host}/repos/{repo}/pulls?" \
+                "state=closed&base={base_branch}&sort=newest&direction=desc"\
+                .format(host=self.github_api_url,
+                        repo=self.github_repository,
+                        base_branch=self.base_branch)
+        return self.github.paginate(query)
+
+    def _get_graphql(self):
+        if self._graphql is None:
+            self._graphql = GithubGraphqlBackend(self.github, self.github_api_url, self.github_repository,
+                                                 self._make_graphql_pr)
+        return self._graphql
+
+    def _commits_url(self, pr_id):
+        return "{host}/repos/{repo}/pulls/{pr_id}/commits".format(host=self.github_api_url,
+                                                                  repo=self.github_repository,
+                                                                  pr_id=pr_id)
+
+    def _make_graphql_pr(self, node):
+        return PullRequest.from_graphql(node, self._commits_url(node['number']))
+
+    def _pr_candidates(self):
+        """ lazy get the PR that might be in the changelog, the most recent first """
+        if self.backend == 'graphql':
+            return self._get_graphql().merged_pull_requests(self.base_branch)
+        return (PullRequest(raw_pr) for raw_pr in self._closed_pr_generator())
 
     def _get_merged_pullrequest(self):
+        if self.pr_discovery == 'local':
+            return self._get_local_merged_pullrequest()
+        if self.pr_discovery == 'search':
+            return self._get_searched_merged_pullrequest()
+        if self.pr_discovery == 'index':
+            return self._get_indexed_merged_pullrequest()
+        return self._scan_merged_pullrequest()
+
+    def _scan_merged_pullrequest(self, seen=None):
+        """ if `seen` is a list, all the PR looked at are added to it """
         lines = []
         nb_successive_merged_pr = 0
-        for raw_pr in self._closed_pr_generator():
-            pr = PullRequest(raw_pr)
-
+        states = ((pr, self._pr_state(pr)) for pr in self._pr_candidates())
+        for pr, state in self._resolve_labels(states):
+            if seen is not None:
+                seen.append(pr)
             # test if PR was merged (not simply closed)
             # and if distant/release contains HEAD of PR
             # (stops after 10 successive merged PR)
-            if pr.is_merged:
-                try:
-                    branches = self.git.branch('-r', '--contains', pr.head_sha1) + '\n'
-                except GitCommandError as e:
-                    # if a PR
-                    #     - is removed by a reset --hard and a push --force
-                    #     - is squashed and merged --fast-foward
-                    # the git history is rewritten
-                    # so pr.head_sha1 does not exist anymore in the git history
-                    # Therefore pr.title will not appear in the changelog
-                    logging.warning("Commit {} of PR {} not found".format(pr.head_sha1, pr.url))
-                    continue
-                # adding separators before and after to match only branch name
-                release_branch_name = ' {remote}/{release}\n'.format(remote=self.remote_name,
-                                                                     release=RELEASE_BRANCH)
-                if release_branch_name in branches:
-                    nb_successive_merged_pr += 1
-                    if nb_successive_merged_pr >= 10:
-                        break
-                else:
-                    # doing the label search as late as possible to save api calls
-                    labels = pr.fetch_labels(self.github_auth)
-                    has_excluded_label = any(l in self.excluded_pr_tag for l in labels)
-
-                    if not has_excluded_label:
-                        lines.append(pr)
-                        nb_successive_merged_pr = 0
+            if state == 'missing':
+                # if a PR
+                #     - is removed by a reset --hard and a push --force
+                #     - is squashed and merged --fast-foward
+                # the git history is rewritten
+                # so pr.head_sha1 does not exist anymore in the git history
+                # Therefore pr.title will not appear in the changelog
+                logging.warning("Commit {} of PR {} not found".format(pr.head_sha1, pr.url))
+            elif state == 'released':
+                nb_successive_merged_pr += 1
+                if nb_successive_merged_pr >= 10:
+                    # leaving the loop cancels the label lookups in flight
+                    break
+            elif state == 'pending':
+                has_excluded_label = any(l in self.excluded_pr_tag for l in pr.labels)
+                if not has_excluded_label:
+                    lines.append(pr)
+                    nb_successive_merged_pr = 0
         return lines
 
-    def _get_hotfix_pullrequest(self):
-        hotfix_pullrequests = []
-
-        for pr_id in self.hotfix_pr_ids:
-            query = "{host}/repos/{repo}/pulls/{pr_id}" .format(host=GITHUB_API_URL, 
-                                                                repo=self.github_repository,
-                                                                pr_id=pr_id)
-            github_response = requests.get(query, auth=self.github_auth)
-            if github_response.status_code != 200:
-                message = github_response.json()['message']
-                logging.error(u'Impossible to retrieve PR:\n  %s', message)
+    def _pr_state(self, pr):
+        """
+        'closed' (not merged), 'missing' (head not in the git history), 'released' (head in <remote>/release)
+        or 'pending'
+        """
+        if not pr.is_merged:
+            return 'closed'
+        if not self._commit_exists(pr.head_sha1):
+            return 'missing'
+        if pr.head_sha1 in self._get_release_index():
+            return 'released'
+        return 'pending'
+
+    def _resolve_labels(self, states):
+        """
+        yield the (pr, state) of `states` in the same order, once the labels of the pending PR are known
+
+        The labels missing from the payloads are fetched concurrently (at most `http_pool_size` PR ahead of
+        the one yielded) while the next pages are downloaded and the next PR are checked in git.
+        When the caller stops iterating, the lookups not started yet are cancelled.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.http_pool_size)
+        in_flight = collections.deque()
+        try:
+            for pr, state in states:
+                future = None
+                if state == 'pending' and pr._labels is None:
+                    future = executor.submit(pr.fetch_labels, self.github)
+                in_flight.append((pr, state, future))
+                # the PR ready are given right away, the others when too many are waiting
+                while in_flight and (len(in_flight) > self.http_pool_size or _is_done(in_flight[0][2])):
+                    yield _labels_resolved(in_flight.popleft())
+            while in_flight:
+                yield _labels_resolved(in_flight.popleft())
+        finally:
+            for _, _, future in in_flight:
+                if future is not None:
+                    future.cancel()
+            executor.shutdown(wait=False)
+            if hasattr(states, 'close'):
+                states.close()
+
+    def _local_pr_numbers(self):
+        """ numbers of the PR merged in <remote>/<base> and not yet in <remote>/release, the most recent first """
+        revisions = ['{remote}/{base}'.format(remote=self.remote_name, base=self.base_branch)]
+        if self._get_release_index().tip:
+            revisions.append('^' + self._get_release_index().tip)
+        numbers = self._merged_pr_numbers(*revisions)
+        logging.debug('PR found in the merge commits: {}'.format(numbers))
+        return numbers
+
+    def _merged_pr_numbers(self, *log_args):
+        """ numbers of the PR in the subjects of the merge (or squash) commits of a git log, the most recent first """
+        numbers = []
+        for subject in self.git.log('--format=%s', *log_args).splitlines():
+            match = MERGE_COMMIT_PR_RE.search(subject) or SQUASH_COMMIT_PR_RE.search(subject)
+            if match and int(match.group(1)) not in numbers:
+                numbers.append(int(match.group(1)))
+        return numbers
+
+    def _get_local_merged_pullrequest(self):
+        """
+        the PR are found in the local history, github is only called to get their title, url and labels
+        so the number of api calls depends on the size of the release and not on the size of the repository
+        """
+        pullrequests = self._fetch_pull_requests(self._local_pr_numbers())
+        states = ((pr, 'pending' if pr.is_merged else 'closed') for pr in pullrequests)
+        return [pr for pr, state in self._resolve_labels(states)
+                if state == 'pending' and not any(l in self.excluded_pr_tag for l in pr.labels)]
+
+    def _get_pr_index(self):
+        if self._pr_index is None:
+            self._pr_index = PullRequestIndex(os.path.join(self._state_dir(), 'pr_index.sqlite'),
+                                              self.github_repository, self.base_branch)
+        return self._pr_index
+
+    def _updated_pr_generator(self, since):
+        """ lazy get the closed PR updated since a date, the most recently updated first """
+        query = "{host}/repos/{repo}/pulls?" \
+                "state=closed&base={base_branch}&sort=updated&direction=desc"\
+                .format(host=self.github_api_url,
+                        repo=self.github_repository,
+                        base_branch=self.base_branch)
+        for raw_pr in self.github.paginate(query):
+            # the dates are all in the same ISO 8601 UTC format, they can be compared as strings
+            if raw_pr['updated_at'] < since:
                 return
-            pr = PullRequest(github_response.json())
-            hotfix_pullrequests.append(pr)
+            yield PullRequest(raw_pr)
+
+    def _get_indexed_merged_pullrequest(self):
+        """
+        only the PR updated since the last release are fetched, the older ones come from the local index
+
+        Nothing is stored here (dry runs leave the index as it is): the PR seen, the new watermark and the
+        PR already released are stored with the PR of the release once it is published (see _update_pr_index)
+        """
+        index = self._get_pr_index()
+        watermark = index.watermark()
+        seen = []
+        if watermark is None:
+            logging.info('the PR index is empty, it is initialized with a scan of the closed PR')
+            self._scan_merged_pullrequest(seen=seen)
+        else:
+            logging.debug('fetching the PR updated since {}'.format(watermark))
+            seen = list(self._updated_pr_generator(watermark))
+
+        candidates = {indexed_pr['number']: PullRequest.from_index(indexed_pr) for indexed_pr in index.pending()}
+        candidates.update((pr.number, pr) for pr in seen)
+
+        lines = []
+        already_released = {}
+        # the version might not have been computed (daemon), and the tag is not needed by the other discoveries
+        last_tag = self._describe_last_tag()
+        states = ((candidates[number], self._pr_state(candidates[number]))
+                  for number in sorted(candidates, reverse=True))
+        for pr, state in self._resolve_labels(states):
+            if state == 'released':
+                already_released[pr.number] = last_tag
+            elif state == 'missing':
+                logging.warning("Commit {} of PR {} not found".format(pr.head_sha1, pr.url))
+            elif state == 'pending' and not any(l in self.excluded_pr_tag for l in pr.labels):
+                lines.append(pr)
+
+        new_watermark = max([pr.updated_at for pr in seen if pr.updated_at] + [watermark or ''])
+        self._pr_index_update = {'seen': [pr.to_index() for pr in seen],
+                                 'watermark': new_watermark or None,
+                                 'released': already_released,
+                                 'heads': {number: pr.head_sha1 for number, pr in candidates.items()}}
+        return lines
+
+    def get_indexed_pending_pullrequests(self):
+        """ the PR of the local index not released yet, without any network access """
+        lines = []
+        for indexed_pr in self._get_pr_index().pending():
+            pr = PullRequest.from_index(indexed_pr)
+            if pr.head_sha1 in self._get_release_index():
+                continue
+            if not any(l in self.excluded_pr_tag for l in pr.labels):
+                lines.append(pr)
+        return lines
 
+    def _update_pr_index(self, tag_name):
+        """
+        once the release is published, what the discovery found and the PR released are stored in one transaction
+
+        A PR is only marked as released once it is in <remote>/release: the PR of a release published locally and
+        not pushed stay pending, the release might be discarded. The excluded PR merged with the release are
+        marked too.
+        """
+        if self.pr_discovery != 'index' or self.release_type == 'hotfix' or self._pr_index_update is None:
+            return
+        self._release_index = None  # <remote>/release has moved if the release has been pushed
+        release_index = self._get_release_index()
+        released = dict(self._pr_index_update['released'])
+        released.update((number, tag_name) for number, head in self._pr_index_update['heads'].items()
+                        if number not in released and head in release_index)
+        self._get_pr_index().update(self._pr_index_update['seen'], self._pr_index_update['watermark'], released)
+        self._pr_index_update = None
+        logging.debug('PR index updated, {} PR released'.format(len(released)))
+
+    def _release_point(self):
+        """
+        (commit date, timestamp) of the last commit of <remote>/<base> that went in <remote>/release
+
+        This is when the last release was cut (the last tag can be a hotfix, which does not contain
+        the base branch), every PR merged in the base branch after it is not released yet.
+        """
+        release_index = self._get_release_index()
+        if not release_index.tip:
+            return None
+        base = '{remote}/{base}'.format(remote=self.remote_name, base=self.base_branch)
+        for line in self.git.log('--first-parent', '--format=%H %ct %cI', base).splitlines():
+            sha, timestamp, date = line.split(' ', 2)
+            if sha in release_index:
+                return date, int(timestamp)
+        return None
+
+    def _get_searched_merged_pullrequest(self):
+        """
+        the PR merged since the last release are found with the search api, labels included,
+        so there are only a few api calls whatever the number of closed PR in the repository
+        """
+        release_point = self._release_point()
+        if release_point is None:
+            logging.warning('no previous release found, falling back to the scan of the closed PR')
+            return self._scan_merged_pullrequest()
+        since, timestamp = release_point
+
+        search = 'repo:{repo} is:pr is:merged base:{base} merged:>={since}'.format(repo=self.github_repository,
+                                                                                   base=self.base_branch,
+                                                                                   since=since)
+        query = "{host}/search/issues?{params}".format(host=self.github_api_url,
+                                                       params=urlencode({'q': search,
+                                                                         'sort': 'created',
+                                                                         'order': 'desc'}))
+        total_count = []
+
+        def first_page(response):
+            # the search api has a low rate limit, the pages are not fetched if the results are capped
+            total_count.append(response.json().get('total_count', 0))
+            return total_count[0] < SEARCH_MAX_RESULTS
+
+        prs = [PullRequest.from_search(item, self._commits_url(item['number']))
+               for item in self.github.paginate(query, items_key='items', first_page=first_page)]
+        if (total_count and total_count[0] >= SEARCH_MAX_RESULTS) or len(prs) >= SEARCH_MAX_RESULTS:
+            logging.warning('too many PR for the search api, falling back to the scan of the closed PR')
+            return self._scan_merged_pullrequest()
+
+        # the search only knows the merge dates of github, which can be later than the commit dates (a merge
+        # pushed after being made), and the search results have no head sha to check: the PR already in
+        # <remote>/release around the release point are left out with the subjects of its merge commits
+        released = set(self._merged_pr_numbers('--since=@{}'.format(timestamp - SEARCH_DATE_MARGIN),
+                                                self._get_release_index().tip))
+        return [pr for pr in prs if pr.number not in released
+                and not any(l in self.excluded_pr_tag for l in pr.fetch_labels(self.github))]
+
+    def _fetch_pull_request(self, pr_id):
+        query = "{host}/repos/{repo}/pulls/{pr_id}".format(host=self.github_api_url,
+                                                           repo=self.github_repository,
+                                                           pr_id=pr_id)
+        github_response = self.github.get(query)
+        if github_response.status_code != 200:
+            message = github_response.json()['message']
+            logging.warning(u'Impossible to retrieve PR {}:\n  {}'.format(pr_id, message))
+            return None
+        return PullRequest(github_response.json())
+
+    def _fetch_pull_requests(self, pr_ids):
+        """ get some PR by number, concurrently. The PR that cannot be retrieved are skipped """
+        if self.backend == 'graphql':
+            try:
+                return self._get_graphql().pull_requests(pr_ids)
+            except GraphqlError as e:
+                logging.error(u'Impossible to retrieve PR:\n  %s', e)
+                return []
+        with ThreadPoolExecutor(max_workers=self.http_pool_size) as executor:
+            return [pr for pr in executor.map(self._fetch_pull_request, pr_ids) if pr is not None]
+
+    def _state_dir(self):
+        """ directory where the data kept between runs are stored """
+        return os.path.join(self.repo.git_dir, 'githubflow_release')
+
+    def _get_release_index(self):
+        """ set of the commits already in <remote>/release, built once per run """
+        if self._release_index is None:
+            release_ref = '{remote}/{release}'.format(remote=self.remote_name, release=RELEASE_BRANCH)
+            cache_file = os.path.join(self._state_dir(), 'reachability', '{}.{}'.format(self.remote_name,
+                                                                                       RELEASE_BRANCH))
+            self._release_index = ReachabilityIndex(self.git, release_ref, cache_file).load()
+        return self._release_index
+
+    def _commit_exists(self, sha):
+        try:
+            # uses the persistent `git cat-file --batch-check` process, no new subprocess per call
+            self.git.get_object_header(sha)
+            return True
+        except ValueError:
+            return False
+
+    def _get_hotfix_pullrequest(self):
+        hotfix_pullrequests = self._fetch_pull_requests(self.hotfix_pr_ids)
+        if len(hotfix_pullrequests) != len(self.hotfix_pr_ids):
+            logging.error(u'Impossible to retrieve all the hotfix PR')
+            exit(1)
         return hotfix_pullrequests
 
     def _get_pull_requests(self):
@@ -213,18 +707,72 @@ class ReleaseManager(object):
         else:
             pullrequests = self._get_hotfix_pullrequest()
 
-        # TODO we could have a way to save the PR in a file to let the user customize it
+        # the PR can be saved in a release plan (plan_out) to be customized before the release (plan_in)
 
         logging.info('merged pr:')
         for p in pullrequests:
             logging.info(' {} - {}'.format(p.title, p.url))
 
-        if not pullrequests:
-            logging.warning('no changes detected, no release to do')
-            exit(0)
-
         return pullrequests
 
+    def _remote_tips(self):
+        """ sha of the remote base and release branches (None if a branch does not exist) """
+        tips = {}
+        for branch in (self.base_branch, RELEASE_BRANCH):
+            ref = '{remote}/{branch}'.format(remote=self.remote_name, branch=branch)
+            try:
+                tips[ref] = self.git.rev_parse('--verify', '{}^{{commit}}'.format(ref))
+            except GitCommandError:
+                tips[ref] = None
+        return tips
+
+    def _write_plan(self, version, pullrequests):
+        if self.release_type == 'hotfix':
+            # the commits to cherry-pick are part of the plan, github is not called again for them
+            self._fetch_commits(pullrequests)
+        write_plan(self.plan_out, {'version': version,
+                                   'release_type': self.release_type,
+                                   'github_repo': self.github_repository,
+                                   'base_branch': self.base_branch,
+                                   'tips': self._remote_tips(),
+                                   'pull_requests': [dict(pr.to_index(), commits=pr.commits)
+                                                     for pr in pullrequests]})
+        logging.info('release plan written in {}'.format(self.plan_out))
+
+    def _read_plan(self):
+        """ version and PR of the release plan, refused if the remote branches have moved since it was made """
+        try:
+            plan = read_plan(self.plan_in)
+        except ReleasePlanError as e:
+            logging.error(e)
+            exit(1)
+        for field, value in (('release_type', self.release_type), ('github_repo', self.github_repository),
+                             ('base_branch', self.base_branch)):
+            if plan[field] != value:
+                logging.error(u'the release plan has been made with {} {}, not {}'.format(field, plan[field], value))
+                exit(1)
+
+        with self.metrics.span('fetch'):
+            self._update_repository()
+        moved = moved_tips(plan, self._remote_tips())
+        if moved:
+            for ref, planned_tip, tip in moved:
+                logging.error(u'{} has moved since the release plan was made ({} -> {})'.format(ref, planned_tip, tip))
+            logging.error(u'the release plan is outdated, make a new one')
+            exit(1)
+        tag_name = self.tag_name_format.format(version=plan['version'])
+        if tag_name in self.repo.tags:
+            logging.error(u'the tag {} already exists, the release plan has already been released'.format(tag_name))
+            exit(1)
+
+        pullrequests = []
+        for planned_pr in plan['pull_requests']:
+            pr = PullRequest.from_index(planned_pr)
+            pr.commits = planned_pr.get('commits')
+            pullrequests.append(pr)
+        logging.info('release {} from the plan {} ({} PR)'.format(plan['version'], self.plan_in, len(pullrequests)))
+        return plan['version'], pullrequests
+
     def get_parent_branch(self):
         """ get the branch we want to start working on """
         if self.release_type in ["major", "minor"]:
@@ -247,6 +795,11 @@ class ReleaseManager(object):
         tmp_branch = self.repo.create_head(tmp_name, '{remote}/{parent}'.format(remote=self.remote_name,
                                                                                 parent=parent_branch))
 
+        if self.no_checkout:
+            if self.generate_debian_changelog:
+                self._commit_debian_changelog(tmp_branch, prs, version)
+            return tmp_branch
+
         logging.debug("current branch {}".format(self.repo.active_branch))
 
         if self.generate_debian_changelog:
@@ -267,6 +820,9 @@ class ReleaseManager(object):
         self.repo.create_tag(tag_name, ref=RELEASE_BRANCH, message=changelog)
 
     def _publish(self, version, tmp_branch, changelog):
+        if self.no_checkout:
+            return self._publish_without_checkout(version, tmp_branch, changelog)
+
         #merge with the release branch
         try:
             self.git.checkout(RELEASE_BRANCH)
@@ -291,6 +847,51 @@ class ReleaseManager(object):
         logging.debug('deleting temporary branch {}'.format(tmp_branch))
         self.repo.delete_head(tmp_branch)
 
+        self._push()
+
+    def _publish_without_checkout(self, version, tmp_branch, changelog):
+        """
+        same as _publish, but the merge commits are made with `git merge-tree` and `git commit-tree`
+        and the branches are moved with `git update-ref`: the working tree and the index are not touched
+        (unless one of the updated branches is the one checked out)
+        """
+        self._get_local_branch(RELEASE_BRANCH)
+        self._get_local_branch(self.base_branch)
+        previous_tips = {name: self.git.rev_parse('refs/heads/{}'.format(name))
+                         for name in (RELEASE_BRANCH, self.base_branch)}
+
+        no_ff_merge(self.git, RELEASE_BRANCH, tmp_branch.path, tmp_branch.name)
+
+        #we tag the release
+        logging.info("tag: {}".format(changelog))
+        self.tag(version, changelog)
+
+        #and we merge back the release branch to master/dev (at least for the tag in release)
+        no_ff_merge(self.git, self.base_branch, 'refs/heads/{}'.format(RELEASE_BRANCH), RELEASE_BRANCH)
+
+        if not self.repo.head.is_detached and self.repo.active_branch.name in previous_tips:
+            # the checked out branch has moved, the working tree is updated with the changes only
+            self.git.update_index('-q', '--refresh')
+            self.git.read_tree('-m', '-u', previous_tips[self.repo.active_branch.name], self.repo.active_branch)
+
+        logging.debug('deleting temporary branch {}'.format(tmp_branch))
+        self.repo.delete_head(tmp_branch, force=True)
+
+        self._push()
+
+    def _get_local_branch(self, name):
+        """ the local branch `name`, created like `git checkout` would if it does not exist """
+        if name in self.repo.heads:
+            return self.repo.heads[name]
+        remote_ref = '{remote}/{name}'.format(remote=self.remote_name, name=name)
+        if remote_ref in [ref.name for ref in self.repo.remote(self.remote_name).refs]:
+            branch = self.repo.create_head(name, remote_ref)
+            branch.set_tracking_branch(self.repo.remote(self.remote_name).refs[name])
+            return branch
+        logging.warning("impossible to find {}. We'll try to create the branch".format(name))
+        return self.repo.create_head(name)
+
+    def _push(self):
         if self.auto_push:
             logging.info("Automatically push: {}, {} and tags".format(self.base_branch, RELEASE_BRANCH))
             self.repo.remote(self.remote_name).push([self.base_branch, RELEASE_BRANCH, '--tags'])
@@ -303,6 +904,11 @@ class ReleaseManager(object):
     def _update_repository(self):
         """we fetch all latest changes"""
         logging.info('fetching changes')
+        if self.fetch_mode == 'targeted':
+            # only the refs needed by the release, and the hotfix PR to get their commits
+            branches = [b for b in (self.base_branch, RELEASE_BRANCH) if b]
+            targeted_fetch(self.git, self.remote_name, branches, pull_requests=self.hotfix_pr_ids)
+            return
         self.repo.remote(self.remote_name).fetch("--tags")
 
     def _generate_debian_changelog(self, pullrequests, version):
@@ -310,14 +916,35 @@ class ReleaseManager(object):
 
         changelog_filename = os.path.join(self.project_path, "debian/changelog")
 
-        for pr in pullrequests:
-            changelog = '{title}  <{url}>'.format(title=pr.title, url=pr.url)
-            dch = 'dch --newversion "{v}" "{text}"'.format(v=version, text=changelog)
-            logging.debug('running : ' + dch)
-            os.system('cd {project} && {cmd}; cd -'.format(project=self.project_path, cmd=dch))
+        entries = ['{title}  <{url}>'.format(title=pr.title, url=pr.url) for pr in pullrequests]
+        update_changelog(changelog_filename, version, entries, self._get_debian_maintainer())
 
         self.files_to_commit.append(changelog_filename)
 
+    def _get_debian_maintainer(self):
+        """ maintainer of the debian changelog entry, like dch: from the environment, else from the git config """
+        maintainer = maintainer_from_env()
+        if maintainer:
+            return maintainer
+        return u'{} <{}>'.format(self.git.config('user.name'), self.git.config('user.email'))
+
+    def _commit_debian_changelog(self, tmp_branch, pullrequests, version):
+        """ the debian changelog of the temporary branch is updated and committed on it, without checkout """
+        logging.info('generating debian changelog')
+
+        entries = ['{title}  <{url}>'.format(title=pr.title, url=pr.url) for pr in pullrequests]
+        previous = tmp_branch.commit.tree / 'debian/changelog'
+        changelog = io.StringIO()
+        prepend_stanza(io.StringIO(previous.data_stream.read().decode('utf-8')), changelog, version, entries,
+                       self._get_debian_maintainer())
+        content = changelog.getvalue().encode('utf-8')
+        blob = self.repo.odb.store(IStream(Blob.type, len(content), io.BytesIO(content)))
+
+        old_tip = tmp_branch.commit.hexsha
+        commit = commit_files(self.git, self.repo.git_dir, old_tip, {'debian/changelog': blob.hexsha.decode()},
+                              "Version {}".format(version))
+        update_ref(self.git, tmp_branch.path, commit, old_tip)
+
     def _generate_changelog(self, version, pullrequests):
         changelog = self.tag_header_format.format(version=version)
         for pr in pullrequests:
@@ -332,12 +959,32 @@ def init_log():
     logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
 
 
+def _cache_dir(cache_dir, use_cache):
+    if not use_cache:
+        return None
+    return cache_dir or default_cache_dir()
+
+
 def new_version(project_path='.',
                 release_type='minor',
                 remote_name='upstream',
                 github_user=None,
-                github_token=None
+                github_token=None,
+                cache_dir=None,
+                use_cache=True,
+                fetch_mode='all',
+                tag_source='describe',
+                metrics=None
                 ):
+    """
+    version of the next release
+
+    With tag_source='describe' the remote is fetched and the last tag is found with `git describe`, with
+    'remote' or 'local' the highest version of the remote tags (git ls-remote) or of the local tags is bumped,
+    without any fetch.
+    """
+    if tag_source != 'describe':
+        return next_version(project_path, release_type, remote_name if tag_source == 'remote' else None, metrics)
     manager = ReleaseManager(path=project_path,
                              release_type=release_type,
                              remote_name=remote_name,
@@ -348,10 +995,37 @@ def new_version(project_path='.',
                              generate_debian_changelog=None,
                              hotfix_pr_ids=None,
                              excluded_pr_tag=None,
-                             dry_run=None)
+                             dry_run=None,
+                             cache_dir=_cache_dir(cache_dir, use_cache),
+                             fetch_mode=fetch_mode,
+                             metrics=metrics)
     return manager.update_and_get_new_version()
 
 
+def pending_pull_requests(project_path='.',
+                          remote_name='upstream',
+                          github_repo=None,
+                          base_branch='master',
+                          excluded_pr_tag=None):
+    """
+    changelog of the pull requests merged and not released yet, read from the local PR index
+    (filled by the releases made with pr_discovery='index'). There is no network access.
+    """
+    excluded_pr_tag = ['hotfix', 'not_in_changelog'] if excluded_pr_tag is None else excluded_pr_tag
+    manager = ReleaseManager(path=project_path,
+                             release_type=None,
+                             remote_name=remote_name,
+                             github_repo=github_repo,
+                             github_user=None,
+                             github_token=None,
+                             base_branch=base_branch,
+                             generate_debian_changelog=None,
+                             hotfix_pr_ids=None,
+                             excluded_pr_tag=excluded_pr_tag,
+                             dry_run=None)
+    return ''.join(manager.tag_pr_line_format.format(pr=pr) for pr in manager.get_indexed_pending_pullrequests())
+
+
 def release(project_path='.',
             release_type='minor',
             remote_name='upstream',
@@ -363,7 +1037,22 @@ def release(project_path='.',
             hotfix_pr_ids=None,
             excluded_pr_tag=None,
             dry_run=None,
-            auto_push=None):
+            auto_push=None,
+            cache_dir=None,
+            use_cache=True,
+            http_pool_size=DEFAULT_POOL_SIZE,
+            http_max_retries=DEFAULT_MAX_RETRIES,
+            github_api_url=GITHUB_API_URL,
+            backend='rest',
+            pr_discovery='scan',
+            no_checkout=False,
+            fetch_mode='all',
+            git_trace=None,
+            metrics_file=None,
+            metrics_hook=None,
+            rate_limiter=None,
+            plan_in=None,
+            plan_out=None):
     """
     Used to do a release base on  git flow  of a github project
     The main use of it is to have a nice changelog based on the github pull request merged since last release
@@ -380,10 +1069,35 @@ def release(project_path='.',
     * generate_debian_changelog: boolean used to activate the generation of a debian changelog
     * excluded_pr_tag: list of tags used not to put a given pull request in the changelog
     * dry-run: Display changelog without doing the release
+    * cache_dir: directory of the github api cache (default to ~/.cache/githubflow_release)
+    * use_cache: boolean used to deactivate the github api cache
+    * http_pool_size: number of connections kept alive to github
+    * http_max_retries: number of retries of a github api call in error
+    * github_api_url: url of the github api (to use github enterprise for example)
+    * backend: github api used to fetch the pull requests, 'rest' or 'graphql'
+    * pr_discovery: how the merged pull requests are found, 'scan' (github closed pull requests),
+      'local' (merge commits of the base branch), 'search' (github search of the pull requests merged since
+      the last release) or 'index' (local index of the pull requests, only the ones updated since the last
+      release are fetched)
+    * no_checkout: boolean used to publish the release without checking out the branches (needs git >= 2.38)
+    * fetch_mode: 'all' to fetch all the branches and tags of the remote, 'targeted' to only fetch the base
+      branch, the release branch and the tags, when they changed
+    * git_trace: log the git commands ('1') or the git commands and their output ('full')
+    * metrics_file: file where the timing of the phases of the release and the number of github requests and git
+      commands are written (json)
+    * metrics_hook: 'module:function' of a function called with each span (phase) of the release when it ends
+    * rate_limiter: github rate limiter, to share the github rate limit between several releases
+    * plan_out: file where the release plan (version, pull requests, tips of the branches) is written, usually
+      with dry_run, to be reviewed or edited
+    * plan_in: release plan to release from, instead of looking for the pull requests again. The release is
+      refused if the branches have moved since the plan was made
+
+    The version released is returned (None for a dry run or if there was nothing to release).
     """
     init_log()
 
     excluded_pr_tag = ['hotfix', 'not_in_changelog'] if excluded_pr_tag is None else excluded_pr_tag
+    metrics = Metrics(hook=load_hook(metrics_hook) if metrics_hook else None)
 
     manager = ReleaseManager(path=project_path,
                              release_type=release_type,
@@ -396,6 +1110,24 @@ def release(project_path='.',
                              hotfix_pr_ids=hotfix_pr_ids,
                              excluded_pr_tag=excluded_pr_tag,
                              dry_run=dry_run,
-                             auto_push=auto_push)
-
-    manager.release_or_hotfix()
+                             auto_push=auto_push,
+                             cache_dir=_cache_dir(cache_dir, use_cache),
+                             http_pool_size=http_pool_size,
+                             http_max_retries=http_max_retries,
+                             github_api_url=github_api_url,
+                             backend=backend,
+                             pr_discovery=pr_discovery,
+                             no_checkout=no_checkout,
+                             fetch_mode=fetch_mode,
+                             git_trace=git_trace,
+                             metrics=metrics,
+                             rate_limiter=rate_limiter,
+                             plan_in=plan_in,
+                             plan_out=plan_out)
+
+    try:
+        return manager.release_or_hotfix()
+    finally:
+        # also written when the release stops on an error (exit) or raises
+        if metrics_file:
+            metrics.write(metrics_file)
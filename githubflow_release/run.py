@@ -14,6 +14,18 @@ Usage:
                      [--hotfix-pr-id <pr-id>]...
                      [--dry-run]
                      [--auto-push]
+                     [--no-cache | --cache-dir <DIR>]
+                     [--http-pool-size <n>]
+                     [--http-max-retries <n>]
+                     [--github-api-url <url>]
+                     [--backend <backend>]
+                     [--pr-discovery <mode>]
+                     [--no-checkout]
+                     [--fetch-mode <mode>]
+                     [--git-trace]
+                     [--metrics-file <FILE>]
+                     [--metrics-hook <hook>]
+                     [--plan-out <FILE> | --plan-in <FILE>]
   githubflow_release (-h | --help)
   githubflow_release --version
 
@@ -33,13 +45,47 @@ Options:
   --hotfix-pr-id <pr-id>    Hotfix PR ID (multiple values accepted)
   --dry-run                 Display changelog without doing the release
   --auto-push               Automatic push release and tags
+  --no-cache                Do not use the github api cache
+  --cache-dir <DIR>         Github api cache directory (default: ~/.cache/githubflow_release)
+  --http-pool-size <n>      Number of connections kept alive to github  [default: 10]
+  --http-max-retries <n>    Number of retries of a github api call in error  [default: 5]
+  --github-api-url <url>    Github api url  [default: https://api.github.com]
+  --backend <backend>       Github api used to fetch the PR, 'rest' or 'graphql' (default: rest)
+  --pr-discovery <mode>     How the merged PR are found, 'scan' (github closed PR), 'local' (merge commits),
+                            'search' (github search of the PR merged since the last release) or 'index' (local
+                            index of the PR, only the PR updated since the last release are fetched)
+                            (default: scan)
+  --no-checkout             Publish the release without checking out any branch (needs git >= 2.38, and
+                            git >= 2.40 for hotfixes)
+  --fetch-mode <mode>       What is fetched from the remote, 'all' (all the branches and tags) or 'targeted' (only
+                            the base branch, the release branch and the tags, skipped if they did not change)
+                            (default: all)
+  --git-trace               Log the git commands
+  --metrics-file <FILE>     Write the duration of each phase of the release, with the number of github requests
+                            and git commands, in a json file
+  --metrics-hook <hook>     Function ('module:function') called with each phase of the release when it ends
+  --plan-out <FILE>         Write the release plan (version and PR) in a json file, to use with --dry-run
+  --plan-in <FILE>          Release from a release plan, without looking for the PR again (refused if the
+                            branches have moved since the plan was made)
 """
+import os
 from docopt import docopt
-from githubflow_release.release import release
+
+
+def read_defaults_file(path):
+    """ values of the defaults file, empty if there is none """
+    if not path or not os.path.exists(path):
+        return {}
+    import yaml
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
 
 
 def main():
     arguments = docopt(__doc__, version='Github Flow Release 1.0.0')
+    defaults = read_defaults_file(arguments['--defaults-file'])
+    # imported here, so that --help and --version do not load git and requests
+    from githubflow_release.release import release
 
     release(project_path=arguments['--project-path'],
             release_type=arguments['--release-type'],
@@ -52,7 +98,21 @@ def main():
             hotfix_pr_ids=arguments['--hotfix-pr-id'],
             excluded_pr_tag=arguments['--excluded-pr-tag'],
             dry_run=arguments['--dry-run'],
-            auto_push=arguments['--auto-push'])
+            auto_push=arguments['--auto-push'],
+            cache_dir=arguments['--cache-dir'],
+            use_cache=not arguments['--no-cache'],
+            http_pool_size=int(arguments['--http-pool-size']),
+            http_max_retries=int(arguments['--http-max-retries']),
+            github_api_url=arguments['--github-api-url'],
+            backend=arguments['--backend'] or defaults.get('backend', 'rest'),
+            pr_discovery=arguments['--pr-discovery'] or defaults.get('pr_discovery', 'scan'),
+            no_checkout=arguments['--no-checkout'],
+            fetch_mode=arguments['--fetch-mode'] or defaults.get('fetch_mode', 'all'),
+            git_trace='1' if arguments['--git-trace'] else None,
+            metrics_file=arguments['--metrics-file'],
+            metrics_hook=arguments['--metrics-hook'],
+            plan_out=arguments['--plan-out'],
+            plan_in=arguments['--plan-in'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,74 @@
+"""
+Computation of the next version from the tags of a repository, without fetching nor walking the history
+
+The tags are read from the remote (`git ls-remote --tags`) or from the local refs, and the highest release
+version is bumped. Only git and semver are needed, so it is quick to import and to run.
+"""
+import logging
+import subprocess
+import semver
+
+RELEASE_TYPES = ['major', 'minor', 'hotfix']
+TAG_SOURCES = ['describe', 'remote', 'local']
+
+
+def remote_tags(project_path, remote_name, metrics=None):
+    """ names of the tags of a remote """
+    output = _git(project_path, metrics, 'ls-remote', '--tags', '--refs', remote_name)
+    return [line.split('\t', 1)[1][len('refs/tags/'):] for line in output.splitlines()]
+
+
+def local_tags(project_path, metrics=None):
+    """ names of the tags of the local repository (loose and packed) """
+    output = _git(project_path, metrics, 'for-each-ref', '--format=%(refname:strip=2)', 'refs/tags')
+    return output.splitlines()
+
+
+def parse_tag(tag):
+    """ the version of a tag ('1.2.3' or 'v1.2.3'), None if it is not a release version """
+    try:
+        version = semver.VersionInfo.parse(tag[1:] if tag.startswith('v') else tag)
+    except ValueError:
+        return None
+    if version.prerelease or version.build:
+        return None
+    return version
+
+
+def version_index(tags):
+    """ sorted list of the release versions of some tags, the bad tags and the prereleases are skipped """
+    versions = (parse_tag(tag) for tag in tags)
+    return sorted(v for v in versions if v is not None)
+
+
+def bump(version, release_type):
+    if release_type == 'major':
+        return version.bump_major()
+    if release_type == 'minor':
+        return version.bump_minor()
+    if release_type == 'hotfix':
+        return version.bump_patch()
+    raise ValueError('{} is not a known release type'.format(release_type))
+
+
+def next_version(project_path, release_type, remote_name=None, metrics=None):
+    """
+    the version of the next release: the highest version of the tags, bumped
+    the tags are the ones of `remote_name`, or the local ones if it is None
+    the git commands are counted in `metrics` if given
+    """
+    if release_type not in RELEASE_TYPES:
+        logging.fatal('{} is not a known release type'.format(release_type))
+        exit(2)
+    tags = remote_tags(project_path, remote_name, metrics) if remote_name else local_tags(project_path, metrics)
+    versions = version_index(tags)
+    if not versions:
+        logging.warning('no version tag found, we assume there is none')
+        versions = [semver.VersionInfo(0, 0, 0)]
+    return str(bump(versions[-1], release_type))
+
+
+def _git(project_path, metrics, *args):
+    if metrics is not None:
+        metrics.incr('git_commands')
+    return subprocess.check_output(['git', '-C', project_path] + list(args), universal_newlines=True)
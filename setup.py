@@ -36,6 +36,8 @@ setup(
     entry_points={'console_scripts': [
         'githubflow_release = githubflow_release.run:main',
         'githubflow_get_new_version = githubflow_release.new_version:main',
+        'githubflow_release_batch = githubflow_release.batch:main',
+        'githubflow_release_daemon = githubflow_release.daemon:main',
     ]},
 )
 